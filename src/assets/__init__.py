@@ -0,0 +1,68 @@
+import logging
+import threading
+import time
+
+import pygame
+
+from src.config import ASSETS_DIR
+
+
+class AssetCache:
+    # Assets shared by every scene of the process, each one loaded and
+    # converted once. Scenes built again (like on every retry) reuse them.
+    def __init__(self, directory=ASSETS_DIR):
+        self.directory = directory
+        self.assets = {}
+
+        # One lock per asset, so building one asset does not hold up the others
+        self.lock = threading.Lock()
+        self.asset_locks = {}
+        self.preload_thread = None
+
+    def get(self, key, factory):
+        # Builds the asset the first time it is asked for. If it is being
+        # built on the preload thread, waits for it instead of building it twice.
+        with self.lock:
+            asset = self.assets.get(key)
+            if asset is not None:
+                return asset
+            asset_lock = self.asset_locks.setdefault(key, threading.Lock())
+
+        with asset_lock:
+            asset = self.assets.get(key)
+            if asset is None:
+                start = time.perf_counter()
+                asset = factory()
+                logging.debug(f"Asset {key} built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+                with self.lock:
+                    self.assets[key] = asset
+
+        return asset
+
+    def load_image(self, name):
+        # Image file decoded as it is on disk
+        return self.get(("file", name), lambda: pygame.image.load(self.directory + name))
+
+    def image(self, name, size=None):
+        # Image converted to the display format for faster blits, and scaled
+        def create():
+            image = self.load_image(name).convert_alpha()
+            if size is not None:
+                image = pygame.transform.scale(image, size)
+            return image
+
+        return self.get(("image", name, size), create)
+
+    def preload(self, assets):
+        # Builds (key, factory) assets on a background thread, e.g. while the
+        # menu is shown, so the scene that needs them starts right away
+        def run():
+            for key, factory in assets:
+                self.get(key, factory)
+
+        self.preload_thread = threading.Thread(target=run, name="asset-preload", daemon=True)
+        self.preload_thread.start()
+
+
+assets = AssetCache()
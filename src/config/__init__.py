@@ -16,6 +16,44 @@ INVALID_VELOCITIES = [(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)]
 VELOCITY_MIN_VALUE = 0.2
 VELOCITY_MAX_VALUE = 1.0
 
+# Velocities are in pixels per tick at BASE_TICK_RATE ticks per second. The
+# simulation can run at another rate, steps are scaled to keep the same speed.
+BASE_TICK_RATE = 60
+SIMULATION_TICK_RATE = 60
+MAX_SIMULATION_STEPS_PER_FRAME = 5
+FRAME_RATE = 60
+
+# With continuous collision detection whole steps are checked, not just
+# their end positions, so the simulation can run on far fewer of them
+CCD_TICK_RATE = 15
+
+# Broad phase used to find points close enough to collide
+DEFAULT_BROADPHASE = "quadtree"
+QUADTREE_CAPACITY = 2
+# Leaves this deep are not split anymore, however many points they hold, so
+# points on the same spot cannot subdivide without end
+QUADTREE_MAX_DEPTH = 16
+# Capacities tried by --capacity auto, and the steps each one is timed for
+QUADTREE_TUNING_CAPACITIES = (1, 2, 4, 8, 16, 32)
+QUADTREE_TUNING_STEPS = 30
+# Share of the points that have to change leaves in a step for the quadtree
+# to be rebuilt at once instead of moving them one by one
+QUADTREE_REBUILD_FRACTION = 0.2
+GRID_CELL_SIZE = 2 * POINT_RADIUS
+
+# Side of the tiles the window is split into to track what changed between frames
+DIRTY_TILE_SIZE = 32
+
+# Seconds a new point shows the spawn animation before it starts moving
+SPAWN_DURATION = 1.0
+
+# Seconds ahead the kinetic scheduler is sure to know every collision. Each
+# point looks for the neighbors it could meet again this often.
+KINETIC_HORIZON = 1.0
+
+# Records a trajectory file makes room for at first, it doubles when full
+TRAJECTORY_INITIAL_RECORDS = 1 << 16
+
 HUD_X_POSITION = CANVAS_X_POSITION + CANVAS_WIDTH + 25
 HUD_Y_POSITION = CANVAS_Y_POSITION
 
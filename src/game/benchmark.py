@@ -0,0 +1,257 @@
+import argparse
+import csv
+import json
+import math
+import random
+import time
+import tracemalloc
+
+from src.config import (
+    CANVAS_WIDTH,
+    CANVAS_X_POSITION,
+    CANVAS_Y_POSITION,
+    GRID_CELL_SIZE,
+    NUMBER_OF_POINTS,
+    POINT_RADIUS,
+)
+from src.game.placement import poisson_disk_positions
+from src.game.quadtree import Point, PointBuffer, Quadtree, Rectangle
+from src.game.quadtree.grid import SpatialHashGrid
+from src.game.quadtree.sweep_and_prune import SweepAndPrune
+
+SIZES = (100, 1000, 10000, 100000)
+CAPACITIES = (1, 2, 4, 8, 16)
+LAYOUTS = ("uniform", "gaussian", "clustered", "poisson")
+
+FIELDS = (
+    "layout",
+    "points",
+    "structure",
+    "capacity",
+    "build_ms",
+    "query_ms",
+    "candidate_pairs",
+    "collisions",
+    "peak_memory_kb",
+)
+
+
+class BruteForce:
+    # Reference broad phase: every pair is a candidate
+    def __init__(self):
+        self.point_list = []
+
+    def update_all(self, point_list):
+        self.point_list = list(point_list)
+
+    def find_all_pairs(self, max_distance):
+        point_list = self.point_list
+        for i, point in enumerate(point_list):
+            for other in point_list[i + 1:]:
+                yield point, other
+
+
+def field_for(amount, fixed_field):
+    # By default the field grows with the number of points so the density
+    # stays the one of the demo and the cases differ only in size
+    if fixed_field:
+        side = CANVAS_WIDTH
+    else:
+        side = math.ceil(CANVAS_WIDTH * math.sqrt(max(amount, NUMBER_OF_POINTS) / NUMBER_OF_POINTS))
+
+    return Rectangle(CANVAS_X_POSITION, CANVAS_Y_POSITION, side, side)
+
+
+def sample_inside(boundary, sample):
+    # Draws again until the point lands in the field, instead of clamping,
+    # which would pile points up on the same edge coordinates
+    while True:
+        x, y = sample()
+        if boundary.x <= x <= boundary.x + boundary.width and boundary.y <= y <= boundary.y + boundary.height:
+            return x, y
+
+
+def uniform_layout(boundary, amount, rng):
+    # Same distribution as Quadtree.create_random_points
+    return [
+        (
+            rng.uniform(boundary.x, boundary.x + boundary.width),
+            rng.uniform(boundary.y, boundary.y + boundary.height),
+        )
+        for _ in range(amount)
+    ]
+
+
+def gaussian_layout(boundary, amount, rng):
+    # Same distribution as Quadtree.create_random_gaussian_points and
+    # create_normal_points, restricted to the field
+    sample = lambda: (
+        abs(rng.gauss(boundary.x + boundary.width / 2, boundary.width / 2)),
+        abs(rng.gauss(boundary.y + boundary.height / 2, boundary.height / 2)),
+    )
+    return [sample_inside(boundary, sample) for _ in range(amount)]
+
+
+def clustered_layout(boundary, amount, rng):
+    # A few hundred points per cluster, packed around random centers
+    clusters = [
+        (
+            rng.uniform(boundary.x, boundary.x + boundary.width),
+            rng.uniform(boundary.y, boundary.y + boundary.height),
+        )
+        for _ in range(max(1, amount // 500))
+    ]
+    spread = 6 * POINT_RADIUS
+
+    def sample():
+        center_x, center_y = rng.choice(clusters)
+        return rng.gauss(center_x, spread), rng.gauss(center_y, spread)
+
+    return [sample_inside(boundary, sample) for _ in range(amount)]
+
+
+def poisson_layout(boundary, amount, rng):
+    # Evenly spread and never overlapping, like the demo starts
+    return poisson_disk_positions(amount, boundary, POINT_RADIUS, rng)
+
+
+LAYOUT_FUNCTIONS = {
+    "uniform": uniform_layout,
+    "gaussian": gaussian_layout,
+    "clustered": clustered_layout,
+    "poisson": poisson_layout,
+}
+
+
+def structures_for(amount, boundary, brute_force_limit):
+    if amount <= brute_force_limit:
+        yield "brute_force", None, BruteForce
+
+    for capacity in CAPACITIES:
+        yield "quadtree", capacity, lambda capacity=capacity: Quadtree(None, boundary, capacity)
+
+    yield "grid", None, lambda: SpatialHashGrid(None, boundary, GRID_CELL_SIZE)
+    yield "sweep", None, lambda: SweepAndPrune(None, boundary)
+
+
+def build_and_query(factory, point_list):
+    max_distance = 2 * Point.collision_radius
+
+    # Points remember their quadtree leaf, they start out of any
+    for point in point_list:
+        point.node = None
+
+    # Built the way the scenes build them: update_all, which loads the whole
+    # quadtree at once when most points are new to it
+    build_start = time.perf_counter()
+    structure = factory()
+    structure.update_all(point_list)
+    build_end = time.perf_counter()
+
+    candidate_pairs = 0
+    collisions = 0
+    for point, other in structure.find_all_pairs(max_distance):
+        candidate_pairs += 1
+        if (
+            math.hypot(point.x - other.x, point.y - other.y)
+            < point.collision_radius + other.collision_radius
+        ):
+            collisions += 1
+    query_end = time.perf_counter()
+
+    return build_end - build_start, query_end - build_end, candidate_pairs, collisions
+
+
+def measure(factory, point_list, repeat):
+    # Timings are the best of a few runs; memory is traced in a separate run
+    # because tracemalloc slows everything down
+    best_build = best_query = math.inf
+    for _ in range(repeat):
+        build, query, candidate_pairs, collisions = build_and_query(factory, point_list)
+        best_build = min(best_build, build)
+        best_query = min(best_query, query)
+
+    tracemalloc.start()
+    build_and_query(factory, point_list)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "build_ms": best_build * 1000,
+        "query_ms": best_query * 1000,
+        "candidate_pairs": candidate_pairs,
+        "collisions": collisions,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def run_benchmarks(sizes, layouts, repeat, seed, brute_force_limit, fixed_field):
+    results = []
+
+    for layout in layouts:
+        for amount in sizes:
+            rng = random.Random(seed)
+            random.seed(seed)
+
+            boundary = field_for(amount, fixed_field)
+            buffer = PointBuffer(amount)
+            point_list = [
+                Point(x, y, buffer) for x, y in LAYOUT_FUNCTIONS[layout](boundary, amount, rng)
+            ]
+
+            for structure, capacity, factory in structures_for(amount, boundary, brute_force_limit):
+                row = {
+                    "layout": layout,
+                    "points": amount,
+                    "structure": structure,
+                    "capacity": capacity if capacity is not None else "",
+                }
+
+                row.update(measure(factory, point_list, repeat))
+
+                print(
+                    f"{layout:>9} {amount:>7} {structure:>11} {row['capacity']!s:>3} "
+                    f"build {row['build_ms']:10.2f} ms  query {row['query_ms']:10.2f} ms  "
+                    f"pairs {row['candidate_pairs']:>9}"
+                )
+                results.append(row)
+
+    return results
+
+
+def write_results(results, output):
+    with open(output + ".csv", "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+    with open(output + ".json", "w") as json_file:
+        json.dump(results, json_file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the collision broad phases")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--layouts", choices=LAYOUTS, nargs="+", default=LAYOUTS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--brute-force-limit", type=int, default=5000)
+    parser.add_argument("--fixed-field", action="store_true")
+    parser.add_argument("--output", default="bench_results")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.sizes,
+        args.layouts,
+        args.repeat,
+        args.seed,
+        args.brute_force_limit,
+        args.fixed_field,
+    )
+    write_results(results, args.output)
+
+    print(f"Results written to {args.output}.csv and {args.output}.json")
+
+
+if __name__ == "__main__":
+    main()
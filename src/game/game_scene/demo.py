@@ -1,5 +1,6 @@
+import logging
 import math
-import random
+import time
 
 import pygame
 
@@ -12,61 +13,125 @@ from src.config import (
     NUMBER_OF_POINTS,
     WINDOW_HEIGHT,
     WINDOW_WIDTH,
+    DEFAULT_BROADPHASE,
+    QUADTREE_CAPACITY,
+    QUADTREE_MAX_DEPTH,
+    BASE_TICK_RATE,
+    SIMULATION_TICK_RATE,
+    MAX_SIMULATION_STEPS_PER_FRAME,
+    FRAME_RATE,
 )
-from src.game.quadtree import Quadtree, Rectangle, Point
+from src.game.placement import poisson_disk_positions
+from src.game.profiler import NULL_PROFILER, ProfilerOverlay
+from src.game.quadtree import Rectangle, Point, PointBuffer
+from src.game.quadtree.broadphase import create_broadphase
+from src.game.quadtree.ccd import ContinuousCollisionDetector
+from src.game.quadtree.tuning import AUTO_CAPACITY, CapacityTuner
+from src.game.game_scene.dirty_rects import DirtyRectTracker, clear_window, update_display
+from src.game.game_scene.hud import HudLayer
+from src.game.game_scene.renderer import PointRenderer
+from src.game.game_scene.timestep import FixedTimestep
 
 
 class DemoGameScene:
-    def __init__(self, window):
+    def __init__(
+        self,
+        window,
+        broadphase=DEFAULT_BROADPHASE,
+        number_of_points=NUMBER_OF_POINTS,
+        tick_rate=SIMULATION_TICK_RATE,
+        workers=1,
+        ccd=False,
+        dirty_rects=False,
+        started_at=None,
+        quadtree_capacity=QUADTREE_CAPACITY,
+        quadtree_max_depth=QUADTREE_MAX_DEPTH,
+        profiler=None,
+    ):
+        # Logged with the first frame, to see how long the scene took to show up
+        self.started_at = time.perf_counter() if started_at is None else started_at
+
         self.window = window
+        self.tick_rate = tick_rate
+
+        # Times the phases of every frame, a no-op unless profiling
+        self.profiler = NULL_PROFILER if profiler is None else profiler
+        self.profiler_overlay = None
+
+        self.step_size = BASE_TICK_RATE / tick_rate
         self.quadtree_boundaries = Rectangle(
             CANVAS_X_POSITION, CANVAS_Y_POSITION, CANVAS_WIDTH, CANVAS_HEIGHT
         )
-        self.quadtree = Quadtree(self.window, self.quadtree_boundaries, 2)
-        # self.quadtree.create_random_points(400)
+        auto_capacity = quadtree_capacity == AUTO_CAPACITY
+        self.broadphase = create_broadphase(
+            broadphase,
+            self.window,
+            self.quadtree_boundaries,
+            QUADTREE_CAPACITY if auto_capacity else quadtree_capacity,
+            quadtree_max_depth,
+        )
+        # Only this broad phase is hooked by the profiler
+        self.profiler.attach(self.broadphase)
+        # self.broadphase.create_random_points(400)
 
-        self.point_list = self.generate_point_list(NUMBER_OF_POINTS)
+        self.point_buffer = PointBuffer()
+        self.point_list = self.generate_point_list(number_of_points)
 
         self.checks_per_frame = 0
+        self.colliding_points = []
+        self.point_renderer = PointRenderer()
+
+        # Only the parts of the window that changed are redrawn and updated
+        self.dirty_rects = None
+        if dirty_rects:
+            self.dirty_rects = DirtyRectTracker(WINDOW_WIDTH, WINDOW_HEIGHT)
+
+        # With more than one worker the narrow phase runs on the point buffer
+        # in separate processes instead of through the broad phase
+        self.collision_engine = None
+        if workers > 1 and not ccd:
+            # Only imported when used, it brings in multiprocessing
+            from src.game.quadtree.parallel import ParallelCollisionEngine
+
+            self.collision_engine = ParallelCollisionEngine(
+                self.quadtree_boundaries, workers
+            )
 
-        for point in self.point_list:
-            self.quadtree.insert(point)
+        # Swept bounds of every point, checked for impacts during the step
+        self.ccd_detector = None
+        if ccd:
+            self.ccd_detector = ContinuousCollisionDetector(self.quadtree_boundaries, self.step_size)
+
+        # The capacity is tuned from the cost of the steps that go through the
+        # quadtree, not the parallel or continuous checks
+        self.capacity_tuner = None
+        self.broadphase_time = 0.0
+        # Time of the move, broad phase and collision parts of the last step
+        self.step_times = (0.0, 0.0, 0.0)
+        if (
+            auto_capacity
+            and broadphase == "quadtree"
+            and self.collision_engine is None
+            and self.ccd_detector is None
+        ):
+            self.capacity_tuner = CapacityTuner(self.broadphase)
+
+        self.broadphase.update_all(self.point_list)
 
     def generate_point_list(self, number_of_points):
-        point_list = []
-        for _ in range(number_of_points):
-            point_list.append(
-                Point(
-                    random.randint(CANVAS_X_POSITION, CANVAS_X_POSITION + CANVAS_WIDTH),
-                    random.randint(
-                        CANVAS_Y_POSITION, CANVAS_Y_POSITION + CANVAS_HEIGHT
-                    ),
-                )
-            )
-
-        # verify if there are any points that are too close to each other
-        for point in point_list:
-            for point2 in point_list:
-                if point != point2:
-                    if (
-                        point.x - point2.x < POINT_RADIUS
-                        and point.x - point2.x > -POINT_RADIUS
-                        and point.y - point2.y < POINT_RADIUS
-                        and point.y - point2.y > -POINT_RADIUS
-                    ):
-                        point_list.remove(point2)
-
-        # verify if there are any points that are close to the border
-        for point in point_list:
-            if (
-                point.x - CANVAS_X_POSITION < POINT_RADIUS
-                or point.x - CANVAS_X_POSITION > CANVAS_WIDTH - POINT_RADIUS
-                or point.y - CANVAS_Y_POSITION < POINT_RADIUS
-                or point.y - CANVAS_Y_POSITION > CANVAS_HEIGHT - POINT_RADIUS
-            ):
-                point_list.remove(point)
+        # Spread over the whole canvas, POINT_RADIUS apart from each other and
+        # from the border
+        area = Rectangle(
+            CANVAS_X_POSITION + POINT_RADIUS,
+            CANVAS_Y_POSITION + POINT_RADIUS,
+            CANVAS_WIDTH - 2 * POINT_RADIUS,
+            CANVAS_HEIGHT - 2 * POINT_RADIUS,
+        )
 
-        return point_list
+        return [
+            Point(x, y, self.point_buffer)
+            for x, y in poisson_disk_positions(number_of_points, area, POINT_RADIUS)
+        ]
 
     def draw_dummy(self):
         pygame.draw.rect(self.window, (255, 0, 0), (0, 0, 100, 100))
@@ -80,90 +145,197 @@ class DemoGameScene:
             1,
         )
 
+    def update_broadphase(self):
+        # Update the broad phase, only points that left their leaf or cell are
+        # moved, or the quadtree is rebuilt at once if many of them did
+        self.profiler.start("tree_update")
+        start = time.perf_counter()
+        self.broadphase.update_all(self.point_list)
+        self.broadphase_time = time.perf_counter() - start
+        self.profiler.stop("tree_update")
+
+    def check_collisions(self):
+        self.profiler.start("collisions")
+        self.find_collisions()
+        self.profiler.stop("collisions")
+
+    def find_collisions(self):
+        # Every unordered pair of nearby airplanes is checked exactly once.
+        # Colliding points are only collected here, so this also runs headless.
+        max_distance = 2 * Point.collision_radius
+        self.colliding_points = []
+
+        if self.ccd_detector is not None:
+            self.check_collisions_continuously()
+            return
+
+        if self.collision_engine is not None:
+            self.check_collisions_in_parallel()
+            return
+
+        start = time.perf_counter()
+        for point, other in self.broadphase.find_all_pairs(max_distance):
+            self.checks_per_frame += 1
+            if (
+                math.hypot(point.x - other.x, point.y - other.y)
+                < point.collision_radius + other.collision_radius
+            ):
+                self.colliding_points.append(point)
+                self.colliding_points.append(other)
+
+                # Kept until the next rendered frame draws the marker
+                point.colliding = True
+                other.colliding = True
+
+        if self.capacity_tuner is not None:
+            self.capacity_tuner.record(
+                self.broadphase_time + time.perf_counter() - start, len(self.point_list)
+            )
+
+    def check_collisions_continuously(self):
+        # Checks the whole motion of the step, so fast points cannot pass
+        # through each other between two positions
+        self.ccd_detector.update(self.point_list)
+
+        for point, other, impact_time in self.ccd_detector.find_impacts():
+            self.checks_per_frame += 1
+            if impact_time is not None:
+                self.colliding_points.append(point)
+                self.colliding_points.append(other)
+
+                point.colliding = True
+                other.colliding = True
+
+    def check_collisions_in_parallel(self):
+        pairs, checks = self.collision_engine.find_collisions(self.point_buffer)
+        self.checks_per_frame += checks
+
+        points = self.point_buffer.points
+        for i, j in pairs.tolist():
+            point = points[i]
+            other = points[j]
+
+            self.colliding_points.append(point)
+            self.colliding_points.append(other)
+
+            point.colliding = True
+            other.colliding = True
+
+    def close(self):
+        if self.collision_engine is not None:
+            self.collision_engine.close()
+
+        if self.profiler_overlay is not None:
+            self.profiler_overlay.close(self.profiler)
+
+    def simulate(self):
+        # One fixed simulation step: move, then find the collisions. The
+        # time of each part is kept for the headless report.
+        start = time.perf_counter()
+        self.profiler.start("move")
+        self.point_buffer.step(self.step_size)
+        self.profiler.stop("move")
+        moved = time.perf_counter()
+
+        self.update_broadphase()
+        updated = time.perf_counter()
+
+        self.check_collisions()
+        self.step_times = (moved - start, updated - moved, time.perf_counter() - updated)
+
     def run(self):
         clock = pygame.time.Clock()
+        timestep = FixedTimestep(self.tick_rate, MAX_SIMULATION_STEPS_PER_FRAME)
         # self.draw_dummy()
         font = pygame.font.Font(None, 30)
 
-        while True:
-            clock.tick(60)
+        hud = HudLayer(track_changes=self.dirty_rects is not None)
+        hud.add_field("fps", font, (0, 255, 0), (CANVAS_WIDTH + 10, 10))
+        hud.add_field("checks_per_frame", font, (0, 255, 0), (CANVAS_WIDTH + 10, 40))
+        hud.add_field("point_list_size", font, (0, 255, 0), (CANVAS_WIDTH + 10, 70))
 
-            # Clear the quadtree
-            self.quadtree.clear()
-            del self.quadtree
+        # Frame profile, shown with F3
+        self.profiler_overlay = ProfilerOverlay((CANVAS_X_POSITION + 5, CANVAS_Y_POSITION + 5))
 
-            # Build the quadtree
-            self.quadtree = Quadtree(self.window, self.quadtree_boundaries, 2)
+        while True:
+            elapsed = clock.tick(FRAME_RATE)
 
-            # Insert the points into the quadtree
-            for point in self.point_list:
-                self.quadtree.insert(point)
+            # Run the simulation steps due since the last frame, however long
+            # drawing it took
+            for _ in range(timestep.advance(elapsed)):
+                self.simulate()
 
-            # Clear the window
-            self.window.fill((0, 0, 0))
+            self.point_buffer.alpha = timestep.alpha
 
             # Calculate FPS
             fps = clock.get_fps()
 
-            # Render FPS
-            fps_text = font.render("FPS: " + str(int(fps)), True, (0, 255, 0))
+            self.profiler.count("checks", self.checks_per_frame)
+            self.profiler.start("hud")
 
-            # Draw FPS
-            self.window.blit(fps_text, (CANVAS_WIDTH + 10, 10))
-
-            # Render checks per frame
-            checks_per_frame_text = font.render(
+            # Fields are only rendered again when their text changes
+            hud.set("fps", "FPS: " + str(int(fps)))
+            hud.set(
+                "checks_per_frame",
                 "Collision checks per frame: " + str(self.checks_per_frame),
-                True,
-                (0, 255, 0),
             )
 
-            # Draw checks per frame
-            self.window.blit(checks_per_frame_text, (CANVAS_WIDTH + 10, 40))
-
             # Reset checks per frame
             self.checks_per_frame = 0
 
-            # Render point list size
-            point_list_size_text = font.render(
-                "Amount of points: " + str(len(self.point_list)), True, (0, 255, 0)
-            )
+            hud.set("point_list_size", "Amount of points: " + str(len(self.point_list)))
+            self.profiler_overlay.update(self.profiler)
+            self.profiler.stop("hud")
+
+            sprite_positions = self.point_renderer.sprite_positions(self.point_buffer)
+
+            dirty = None
+            if self.dirty_rects is not None:
+                dirty = self.dirty_rects.collect_frame(
+                    sprite_positions,
+                    self.point_renderer.sprite_size,
+                    hud,
+                    self.broadphase,
+                    self.profiler_overlay,
+                )
+
+            clear_window(self.window, dirty)
 
-            # Draw point list size
-            self.window.blit(point_list_size_text, (CANVAS_WIDTH + 10, 70))
+            # Draw FPS, checks per frame and point list size
+            self.profiler.start("hud")
+            hud.draw(self.window)
+            self.profiler.stop("hud")
 
             self.draw_canvas_border()
 
-            self.quadtree.draw()
-            # self.quadtree.print_quadtree()
+            # The structure is drawn on its own, points in one batch on top
+            self.profiler.start("tree_draw")
+            self.broadphase.draw(draw_points=False)
+            self.profiler.stop("tree_draw")
 
-            for point in self.point_list:
-                # Create a range around the airplane to check for collisions
-                range = Rectangle(
-                    point.x - point.collision_radius,
-                    point.y - point.collision_radius,
-                    point.collision_radius * 4,
-                    point.collision_radius * 4,
-                )
+            self.profiler.start("points_draw")
+            self.point_renderer.draw(self.window, self.point_buffer, sprite_positions)
+            self.profiler.stop("points_draw")
+            # self.broadphase.print_quadtree()
+
+            self.profiler_overlay.draw(self.window)
+
+            self.point_buffer.clear_flag(PointBuffer.FLAG_COLLIDING)
 
-                # Query the quadtree for nearby airplanes
-                nearby = self.quadtree.query_range(range)
+            self.profiler.start("display")
+            update_display(dirty)
+            self.profiler.stop("display")
 
-                # Check for collisions with each nearby airplane
-                for other in nearby:
-                    self.checks_per_frame += 1
-                    if (
-                        point != other
-                        and math.hypot(point.x - other.x, point.y - other.y)
-                        < point.collision_radius + other.collision_radius
-                    ):
-                        # print(f"Collision detected between {point} and {other}")
-                        point.collide(self.window)
-                        other.collide(self.window)
+            self.profiler.end_frame(self.broadphase)
 
-            pygame.display.update()
+            if self.started_at is not None:
+                logging.info(f"Demo ready in {(time.perf_counter() - self.started_at) * 1000:.0f} ms")
+                self.started_at = None
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.close()
                     pygame.quit()
                     return
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.profiler = self.profiler_overlay.toggle(self.profiler, self.broadphase)
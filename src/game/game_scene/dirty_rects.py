@@ -0,0 +1,131 @@
+import numpy as np
+import pygame
+
+from src.config import DIRTY_TILE_SIZE
+
+
+class DirtyRectTracker:
+    # Regions of the window that changed since the last frame, kept as a mask
+    # of square tiles. Tiles never overlap, so effects blended into the dirty
+    # regions (like the CRT texture) are applied exactly once per pixel.
+    def __init__(self, width, height, tile_size=DIRTY_TILE_SIZE):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+
+        shape = (-(-height // tile_size), -(-width // tile_size))
+        self.tiles = np.zeros(shape, dtype=bool)
+        self.previous_tiles = np.zeros(shape, dtype=bool)
+        self.previous_outlines = set()
+
+        # The first frame has to be drawn whole
+        self.full_redraw = True
+
+    def add(self, rect):
+        rect = pygame.Rect(rect)
+        if rect.width <= 0 or rect.height <= 0:
+            return
+
+        size = self.tile_size
+        first_column = max(0, rect.left // size)
+        first_row = max(0, rect.top // size)
+        last_column = (rect.right - 1) // size
+        last_row = (rect.bottom - 1) // size
+
+        self.tiles[first_row : last_row + 1, first_column : last_column + 1] = True
+
+    def add_boxes(self, left, top, width, height):
+        # Same as add for many boxes of the same size at once, given as arrays
+        # of their corners
+        size = self.tile_size
+        rows, columns = self.tiles.shape
+
+        first_column = left // size
+        first_row = top // size
+        columns_spanned = (width - 1) // size + 2
+        rows_spanned = (height - 1) // size + 2
+
+        right = left + width - 1
+        bottom = top + height - 1
+
+        for row_offset in range(rows_spanned):
+            row = first_row + row_offset
+            for column_offset in range(columns_spanned):
+                column = first_column + column_offset
+
+                inside = (
+                    (row >= 0) & (row < rows) & (column >= 0) & (column < columns)
+                    & (row * size <= bottom) & (column * size <= right)
+                )
+                self.tiles[row[inside], column[inside]] = True
+
+    def add_outlines(self, outlines):
+        # Outlines of the broad phase overlay that appeared or disappeared
+        outlines = set(outlines)
+        for outline in outlines.symmetric_difference(self.previous_outlines):
+            self.add(outline)
+
+        self.previous_outlines = outlines
+
+    def collect_frame(self, sprite_positions, sprite_size, hud, broadphase, profiler_overlay):
+        # Dirty regions of a scene frame: the points where they are drawn now,
+        # the HUD counters that changed, the parts of the broad phase overlay
+        # that changed and the profiler panel
+        self.add_boxes(*sprite_positions, sprite_size, sprite_size)
+        for rect in hud.pop_changed_rects():
+            self.add(rect)
+        self.add_outlines(broadphase.outline_rects())
+
+        overlay_rect = profiler_overlay.get_rect()
+        if overlay_rect is not None:
+            self.add(overlay_rect)
+
+        return self.collect()
+
+    def collect(self):
+        # Dirty regions of this frame: what was drawn now and what was drawn
+        # in the last frame, which has to be erased. Tiles next to each other
+        # in a row are joined into a single rect.
+        if self.full_redraw:
+            dirty = [pygame.Rect(0, 0, self.width, self.height)]
+            self.full_redraw = False
+        else:
+            dirty = []
+            size = self.tile_size
+            for row, line in enumerate(self.tiles | self.previous_tiles):
+                columns = np.flatnonzero(line)
+                if len(columns) == 0:
+                    continue
+
+                # Starts and ends of the runs of consecutive dirty tiles
+                breaks = np.flatnonzero(np.diff(columns) > 1)
+                starts = np.concatenate(([columns[0]], columns[breaks + 1]))
+                ends = np.concatenate((columns[breaks], [columns[-1]]))
+
+                for start, end in zip(starts.tolist(), ends.tolist()):
+                    dirty.append(
+                        pygame.Rect(
+                            start * size, row * size, (end - start + 1) * size, size
+                        ).clip(0, 0, self.width, self.height)
+                    )
+
+        self.previous_tiles, self.tiles = self.tiles, self.previous_tiles
+        self.tiles[:] = False
+
+        return dirty
+
+
+def clear_window(window, dirty):
+    # The whole window, or only the parts that changed
+    if dirty is None:
+        window.fill((0, 0, 0))
+    else:
+        for rect in dirty:
+            window.fill((0, 0, 0), rect)
+
+
+def update_display(dirty):
+    if dirty is None:
+        pygame.display.update()
+    else:
+        pygame.display.update(dirty)
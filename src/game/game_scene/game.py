@@ -14,13 +14,34 @@ from src.config import (
     NUMBER_OF_POINTS,
     WINDOW_HEIGHT,
     WINDOW_WIDTH,
+    DEFAULT_BROADPHASE,
+    QUADTREE_CAPACITY,
+    QUADTREE_MAX_DEPTH,
+    BASE_TICK_RATE,
+    SIMULATION_TICK_RATE,
+    MAX_SIMULATION_STEPS_PER_FRAME,
+    FRAME_RATE,
+    SPAWN_DURATION,
     GAME_SETTINGS,
     HUD_X_POSITION,
     HUD_Y_POSITION,
-    ASSETS_DIR
+    KINETIC_HORIZON,
 )
-from src.game.quadtree import Quadtree, Rectangle, Point
+from src.assets import assets
+from src.game.placement import keep_spaced
+from src.game.profiler import NULL_PROFILER, ProfilerOverlay
+from src.game.quadtree import Rectangle, Point, PointBuffer
+from src.game.quadtree.broadphase import create_broadphase
+from src.game.quadtree.ccd import ContinuousCollisionDetector
+from src.game.quadtree.free_space import free_regions, sample_free_position
+from src.game.quadtree.kinetic import KineticScheduler
+from src.game.quadtree.tuning import AUTO_CAPACITY, CapacityTuner
+from src.game.replay import ReplayRecorder
 from src.game.game_scene.game_over import GameOver
+from src.game.game_scene.dirty_rects import DirtyRectTracker, clear_window, update_display
+from src.game.game_scene.hud import HudLayer, composite_overlays
+from src.game.game_scene.renderer import PointRenderer
+from src.game.game_scene.timestep import FixedTimestep
 
 
 class GameState:
@@ -33,67 +54,169 @@ class GameScene:
     center_x = CANVAS_HEIGHT / 2
     center_y = CANVAS_WIDTH / 2
 
-    def __init__(self, window, difficulty):
+    def __init__(
+        self,
+        window,
+        difficulty,
+        broadphase=DEFAULT_BROADPHASE,
+        tick_rate=SIMULATION_TICK_RATE,
+        ccd=False,
+        dirty_rects=False,
+        started_at=None,
+        quadtree_capacity=QUADTREE_CAPACITY,
+        quadtree_max_depth=QUADTREE_MAX_DEPTH,
+        profiler=None,
+        seed=None,
+        record_path=None,
+        replay=None,
+        kinetic=False,
+    ):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+
         self.window = window
+
+        # A replay plays the game it was recorded with, input included
+        self.replay = replay
+        if replay is not None:
+            difficulty = replay.difficulty
+            tick_rate = replay.tick_rate
+            ccd = replay.ccd
+
+        # Everything random in a game comes from this generator, and time
+        # is counted in simulation ticks, so a seed always plays the same
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.tick = 0
+
+        self.tick_rate = tick_rate
+
+        self.profiler = NULL_PROFILER if profiler is None else profiler
+        self.profiler_overlay = None
+
+        self.step_size = BASE_TICK_RATE / tick_rate
         self.quadtree_boundaries = Rectangle(
             CANVAS_X_POSITION, CANVAS_Y_POSITION, CANVAS_WIDTH, CANVAS_HEIGHT
         )
-        self.quadtree = Quadtree(self.window, self.quadtree_boundaries, 2)
+        auto_capacity = quadtree_capacity == AUTO_CAPACITY
+        self.broadphase = create_broadphase(
+            broadphase,
+            self.window,
+            self.quadtree_boundaries,
+            QUADTREE_CAPACITY if auto_capacity else quadtree_capacity,
+            quadtree_max_depth,
+        )
+        self.profiler.attach(self.broadphase)
         self.checks_per_frame = 0
+
+        self.ccd_detector = None
+        if ccd:
+            self.ccd_detector = ContinuousCollisionDetector(self.quadtree_boundaries, self.step_size)
+
+        # Tuned again as points spawn and the best capacity changes
+        self.capacity_tuner = None
+        if auto_capacity and broadphase == "quadtree" and not ccd:
+            self.capacity_tuner = CapacityTuner(self.broadphase)
+
+        # Fraction of the last step at which the collision happened
+        self.impact_time = 1.0
+
+        self.dirty_rects = None
+        if dirty_rects:
+            self.dirty_rects = DirtyRectTracker(WINDOW_WIDTH, WINDOW_HEIGHT)
+
         self.amount_of_points = GAME_SETTINGS.get(difficulty).get("number_of_points")
         self.generation_radius = GAME_SETTINGS.get(difficulty).get("generation_radius")
         self.collision_point = None
-        self.start_ticks = pygame.time.get_ticks()
+        # The two points of the collision that ended the game
+        self.collision_pair = None
 
         self.difficulty = difficulty
         self.score = 0
 
-        self.point_list = self.generate_point_list()
-        for point in self.point_list:
-            self.quadtree.insert(point)
-        
+        # Spawning, in simulated seconds
+        self.game_state = GameState.PLAYING
+        self.spawn_rate = GAME_SETTINGS.get("easy").get("spawn_rate")
+        self.max_spawn_rate = 5
+        self.spawn_rate_increase = (self.max_spawn_rate - self.spawn_rate) / 600
+        self.last_spawn_time = 0.0
+        self.spawn_start_time = 0.0
+        self.new_point = None
+
+        self.point_buffer = PointBuffer()
+        self.point_renderer = PointRenderer()
+        if replay is not None:
+            self.point_list = [
+                Point(x, y, self.point_buffer, (vx, vy))
+                for x, y, vx, vy in replay.initial_points
+            ]
+        else:
+            self.point_list = self.generate_point_list()
+        self.broadphase.update_all(self.point_list)
+
+        # Collisions predicted from the velocities, only the ones due are
+        # checked. Continuous detection checks whole steps on its own.
+        self.kinetic = None
+        if kinetic and not ccd:
+            self.kinetic = KineticScheduler(
+                self.broadphase, self.step_size, round(KINETIC_HORIZON * tick_rate)
+            )
+            self.kinetic.add_all(self.point_list)
+
+        self.recorder = None
+        if record_path is not None and replay is None:
+            self.recorder = ReplayRecorder(
+                record_path, difficulty, seed, tick_rate, ccd, self.point_list
+            )
+
+        # Static layers, built once per process and shared by every game.
+        # A replay run headless has no window to draw them on.
+        self.overlay = None
+        if window is not None:
+            self.overlay = assets.get("game_overlay", GameScene.create_overlay)
+
+        self.hud = None
+
+    @staticmethod
+    def create_overlay():
         # load image texture
-        crt_texture = pygame.image.load(ASSETS_DIR + 'crt_scanlines.png').convert_alpha()
-        crt_texture.set_alpha(100)
-        self.crt_texture = pygame.transform.scale(crt_texture, (WINDOW_WIDTH, WINDOW_HEIGHT))
+        crt_texture = assets.image('crt_scanlines.png', (WINDOW_WIDTH, WINDOW_HEIGHT))
 
         # load hud image
-        hud_image = pygame.image.load(ASSETS_DIR + 'hud.png').convert_alpha()
-        self.hud_image = pygame.transform.scale(hud_image, (WINDOW_WIDTH, WINDOW_HEIGHT))
+        hud_image = assets.image('hud.png', (WINDOW_WIDTH, WINDOW_HEIGHT))
+
+        # Both static layers merged into a single surface, the CRT scanlines
+        # at the same opacity they were blended with
+        return composite_overlays([(crt_texture, 100), (hud_image, 255)])
+
+    @staticmethod
+    def preload_assets():
+        # Builds the game assets in the background, while the menu is shown
+        assets.preload([("game_overlay", GameScene.create_overlay)])
 
     def generate_point_list(self):
-        point_list = []
-        
+        positions = []
+
         for i in range(self.amount_of_points):
             # Calculate the angle, then the x and y coordinates
             angle = i * 2 * math.pi / self.amount_of_points
             x = self.center_x + self.generation_radius * math.cos(angle)
             y = self.center_y + self.generation_radius * math.sin(angle)
-            point_list.append(Point(x, y))
-
-        # verify if there are any points that are too close to each other
-        for point in point_list:
-            for point2 in point_list:
-                if point != point2:
-                    if (
-                        point.x - point2.x < POINT_RADIUS
-                        and point.x - point2.x > -POINT_RADIUS
-                        and point.y - point2.y < POINT_RADIUS
-                        and point.y - point2.y > -POINT_RADIUS
-                    ):
-                        point_list.remove(point2)
-
-        # verify if there are any points that are close to the border
-        for point in point_list:
-            if (
-                point.x - CANVAS_X_POSITION < POINT_RADIUS
-                or point.x - CANVAS_X_POSITION > CANVAS_WIDTH - POINT_RADIUS
-                or point.y - CANVAS_Y_POSITION < POINT_RADIUS
-                or point.y - CANVAS_Y_POSITION > CANVAS_HEIGHT - POINT_RADIUS
-            ):
-                point_list.remove(point)
+            positions.append((x, y))
+
+        # Drop the points too close to each other or to the border
+        area = Rectangle(
+            CANVAS_X_POSITION + POINT_RADIUS,
+            CANVAS_Y_POSITION + POINT_RADIUS,
+            CANVAS_WIDTH - 2 * POINT_RADIUS,
+            CANVAS_HEIGHT - 2 * POINT_RADIUS,
+        )
 
-        return point_list
+        return [
+            Point(x, y, self.point_buffer, Point.get_random_velocity(self.rng))
+            for x, y in keep_spaced(positions, area, POINT_RADIUS)
+        ]
 
     def draw_canvas_border(self):
         pygame.draw.rect(
@@ -103,76 +226,254 @@ class GameScene:
             1,
         )
 
-    def check_collision(self, point):
-        # Create a range around the airplane to check for collisions
-        range = Rectangle(
-            point.x - point.collision_radius,
-            point.y - point.collision_radius,
-            point.collision_radius * 4,
-            point.collision_radius * 4,
-        )
+    def check_collision(self):
+        if self.ccd_detector is not None:
+            return self.check_collision_continuously()
 
-        # Query the quadtree for nearby airplanes
-        nearby = self.quadtree.query_range(range)
+        if self.kinetic is not None:
+            return self.check_collision_kinetically()
 
-        # Check for collisions with each nearby airplane
-        for other in nearby:
+        # Every unordered pair of nearby airplanes is checked exactly once
+        max_distance = 2 * Point.collision_radius
+
+        for point, other in self.broadphase.find_all_pairs(max_distance):
             self.checks_per_frame += 1
             if (
-                point != other
-                and math.hypot(point.x - other.x, point.y - other.y)
+                math.hypot(point.x - other.x, point.y - other.y)
                 < point.collision_radius + other.collision_radius
             ):
                 logging.info(f"Collision detected between {point} and {other}")
-                point.collide(self.window)
-                other.collide(self.window)
+                point.colliding = True
+                other.colliding = True
+                self.collision_pair = point, other
                 return True
-            
-    def spawn_point(self):
-        quadtree = self.quadtree
-        window = self.window
 
-        while True:
-            new_point = Point(
-                random.randint(CANVAS_X_POSITION + (POINT_RADIUS * 2), CANVAS_X_POSITION + CANVAS_WIDTH - (POINT_RADIUS * 2)),
-                random.randint(CANVAS_Y_POSITION + (POINT_RADIUS * 2), CANVAS_Y_POSITION + CANVAS_HEIGHT - (POINT_RADIUS * 2)),
-            )
-            # Check if new point is far from existing points.
-            spawn_region = Rectangle(new_point.x - new_point.danger_radius,
-                                    new_point.y - new_point.danger_radius,
-                                    2 * new_point.danger_radius,
-                                    2 * new_point.danger_radius)
-            points_near_spawn = quadtree.query_range(spawn_region)
+    def check_collision_kinetically(self):
+        pair = self.kinetic.advance()
+        self.checks_per_frame += self.kinetic.checks
+        self.kinetic.checks = 0
+
+        if pair is None:
+            return False
+
+        point, other = pair
+        logging.info(f"Collision detected between {point} and {other}")
+        point.colliding = True
+        other.colliding = True
+        self.collision_pair = point, other
+        return True
+
+    def check_collision_continuously(self):
+        # Checks the whole motion of the step, so fast airplanes cannot pass
+        # through each other between two positions. The earliest impact is
+        # kept so the game over shows the moment they touched.
+        self.ccd_detector.update(self.point_list)
+
+        impact = None
+        for point, other, impact_time in self.ccd_detector.find_impacts():
+            self.checks_per_frame += 1
+            if impact_time is not None and (impact is None or impact_time < impact[2]):
+                impact = point, other, impact_time
+
+        if impact is None:
+            return False
+
+        point, other, self.impact_time = impact
+        logging.info(f"Collision detected between {point} and {other}")
+        point.colliding = True
+        other.colliding = True
+        self.collision_pair = point, other
+        return True
+
+    def simulate(self):
+        # One fixed simulation step: move, update the broad phase and look for collisions
+        self.profiler.start("move")
+        self.point_buffer.step(self.step_size)
+        self.profiler.stop("move")
+
+        # Only points that left their leaf or cell are moved in the broad
+        # phase, or the quadtree is rebuilt at once if many of them did
+        self.profiler.start("tree_update")
+        start = time.perf_counter()
+        self.broadphase.update_all(self.point_list)
+        self.profiler.stop("tree_update")
+
+        self.profiler.start("collisions")
+        self.collision_point = self.check_collision() or self.collision_point
+        self.profiler.stop("collisions")
+
+        if self.capacity_tuner is not None:
+            self.capacity_tuner.record(time.perf_counter() - start, len(self.point_list))
+
+    def step(self):
+        # One tick of the game: the clicks a replay recorded for it, the
+        # simulation step, then spawning
+        if self.replay is not None:
+            for position in self.replay.clicks.get(self.tick, ()):
+                self.invert_near(position)
+
+        self.simulate()
+        if not self.collision_point:
+            self.update_spawning()
+        self.tick += 1
+
+    def elapsed_seconds(self):
+        return self.tick // self.tick_rate
+
+    def finished(self):
+        # A replay of a game quit before any collision stops where it was quit
+        return self.collision_point or (
+            self.replay is not None and self.replay.finished(self.tick)
+        )
 
-            if not points_near_spawn:
-                break
+    def update_spawning(self):
+        current_time = self.tick / self.tick_rate
+        elapsed_time = current_time - self.last_spawn_time
+
+        if self.game_state == GameState.PLAYING:
+            if elapsed_time >= 10/self.spawn_rate:  # It's time to spawn a new point
+                self.new_point = self.spawn_point()
+
+                if self.new_point is not None:
+                    if self.recorder is not None:
+                        self.recorder.spawn(self.tick, self.new_point)
+
+                    self.game_state = GameState.SPAWNING
+                    self.spawn_start_time = current_time
+                    self.last_spawn_time = current_time  # Reset the last spawn time
+                    self.spawn_rate = min(self.max_spawn_rate, self.spawn_rate + self.spawn_rate_increase * elapsed_time)
+
+        elif self.game_state == GameState.SPAWNING:
+            # The spawn animation plays for a while, then the point starts
+            # moving and colliding
+            if current_time - self.spawn_start_time < SPAWN_DURATION:
+                return
+
+            # The others kept moving during the animation and may have come
+            # too close, the point then shows up again somewhere free
+            if not self.is_clear(self.new_point):
+                if self.relocate_spawn(self.new_point):
+                    self.spawn_start_time = current_time
+                return
+
+            # Into the broad phase right away, so a click on the next tick
+            # finds it like it does in kinetic mode
+            self.new_point.spawning = False
+            self.point_list.append(self.new_point)
+            self.broadphase.update(self.new_point)
+            if self.kinetic is not None:
+                self.kinetic.add(self.new_point)
+            self.game_state = GameState.PLAYING
+
+    def spawning_points(self):
+        # Points playing the spawn animation, out of the broad phase
+        if self.game_state == GameState.SPAWNING:
+            return [self.new_point]
+        return []
+
+    def is_clear(self, point):
+        # No point in the game within the danger radius of point
+        return not self.broadphase.nearest(point.x, point.y, 1, Point.danger_radius)
+
+    def relocate_spawn(self, point):
+        # Moves a point still spawning to a free spot. Recorded like a spawn,
+        # so a replay moves it to the same place. False if there is no room
+        # right now, it is tried again on the next tick.
+        if self.replay is not None:
+            position = self.replay.spawns.get(self.tick)
+        else:
+            others = [other for other in self.spawning_points() if other is not point]
+            position = self.free_spawn_position(others)
+
+        if position is None:
+            return False
+
+        point.move_to(position[0], position[1])
+        if self.recorder is not None:
+            self.recorder.spawn(self.tick, point)
+
+        return True
+
+    def free_spawn_position(self, obstacles):
+        # Regions of the spawn area with no point within the danger radius,
+        # found and sampled in bounded time instead of retrying random spots.
+        # Regions are split down to the point radius, smaller gaps are left out.
+        spawn_area = Rectangle(
+            CANVAS_X_POSITION + (POINT_RADIUS * 2),
+            CANVAS_Y_POSITION + (POINT_RADIUS * 2),
+            CANVAS_WIDTH - (POINT_RADIUS * 4),
+            CANVAS_HEIGHT - (POINT_RADIUS * 4),
+        )
+        regions = free_regions(
+            self.broadphase, spawn_area, Point.danger_radius, POINT_RADIUS, obstacles
+        )
 
-        
-        new_point.draw_spawn(window)
-        update_area = new_point.get_area_rect()
+        return sample_free_position(regions, self.rng)
 
-        pygame.display.update(update_area)
-        
-        time.sleep(1)
+    def click(self, position):
+        # Clicks are part of the recorded input, a replay plays its own
+        if self.replay is not None:
+            return
 
-        return new_point
+        if self.recorder is not None:
+            self.recorder.click(self.tick, position)
+        self.invert_near(position)
 
-    def draw_hud(self, font, fps, elapsed_seconds, score, font_score):
-        # Render FPS
-        fps_text = font.render(str(int(fps)), True, (0, 255, 0))
+    def invert_near(self, position):
+        # Only the closest point whose danger radius covers the cursor turns
+        for point in self.broadphase.nearest(position[0], position[1], 1, Point.danger_radius):
+            point.invert_velocity()
+            if self.kinetic is not None:
+                self.kinetic.velocity_changed(point)
 
-        # Draw FPS
-        self.window.blit(fps_text, (790, 50))
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close(self.tick)
+            self.recorder = None
 
-        # Render checks per frame
-        checks_per_frame_text = font.render(
-            str(self.checks_per_frame),
-            True,
-            (0, 255, 0),
+    def spawn_point(self):
+        if self.replay is not None:
+            # Spawned where and how fast it did in the recorded game
+            state = self.replay.spawns.get(self.tick)
+            if state is None:
+                return None
+
+            x, y, vx, vy = state
+            new_point = Point(x, y, self.point_buffer, (vx, vy))
+            new_point.spawning = True
+            return new_point
+
+        # Points still spawning count too, two spawns never take the same room
+        position = self.free_spawn_position(self.spawning_points())
+        if position is None:
+            # No room right now, tried again on the next frame
+            return None
+
+        # Only the accepted position gets a slot in the point buffer. It plays
+        # the spawn animation, standing still, until it joins the game.
+        new_point = Point(
+            position[0], position[1], self.point_buffer, Point.get_random_velocity(self.rng)
         )
+        new_point.spawning = True
+
+        return new_point
+
+    def create_hud(self, font, font_score):
+        hud = HudLayer(track_changes=self.dirty_rects is not None)
+        hud.add_field("fps", font, (0, 255, 0), (790, 50))
+        hud.add_field("checks_per_frame", font, (0, 255, 0), (790, 570))
+        hud.add_field("time", font, (0, 200, 0), (1050, 50))
+        hud.add_field("point_list_size", font, (0, 255, 0), (830, 690))
+        hud.add_field("score", font_score, (0, 255, 0), (810, 140))
+        if self.kinetic is not None:
+            hud.add_field("next_collision", font, (0, 255, 0), (790, 620))
+        return hud
 
-        # Draw checks per frame
-        self.window.blit(checks_per_frame_text, (790, 570))
+    def update_hud(self, fps, elapsed_seconds, score):
+        hud = self.hud
+
+        hud.set("fps", str(int(fps)))
+        hud.set("checks_per_frame", str(self.checks_per_frame))
 
         # Reset checks per frame
         self.checks_per_frame = 0
@@ -180,115 +481,127 @@ class GameScene:
         # Calculate minutes and seconds
         minutes = elapsed_seconds // 60
         seconds = elapsed_seconds % 60
+        hud.set("time", f"{minutes:02}:{seconds:02}")
 
-        time_text = font.render(f"{minutes:02}:{seconds:02}", True, (0, 200, 0))
-        self.window.blit(time_text, (1050, 50))
+        hud.set("point_list_size", str(len(self.point_list)))
+        hud.set("score", str(score))
 
+        if self.kinetic is not None:
+            # Read off the event queue, no pair is checked for it
+            steps = self.kinetic.steps_to_collision()
+            if steps is None:
+                hud.set("next_collision", f"Next: > {KINETIC_HORIZON:.1f} s")
+            else:
+                hud.set("next_collision", f"Next: {steps / self.tick_rate:.1f} s")
 
-        # Render point list size
-        point_list_size_text = font.render(
-            str(len(self.point_list)), True, (0, 255, 0)
-        )
+    def draw_hud(self):
+        self.hud.draw(self.window)
 
-        # Draw point list size
-        self.window.blit(point_list_size_text, (830, 690))
-
-        # render score
-        score_text = font_score.render(str(score), True, (0, 255, 0))
-        self.window.blit(score_text, (810, 140))
-
-    
     def run(self):
 
-        self.start_ticks = pygame.time.get_ticks()
-        game_state = GameState.PLAYING
         running = True
 
         font = pygame.font.Font(None, 42)
 
         font_score = pygame.font.Font(None, 60)
 
-        clock = pygame.time.Clock()
-        
-        max_spawn_rate = 5 
+        self.hud = self.create_hud(font, font_score)
 
-        last_spawn_time = time.time()
+        self.profiler_overlay = ProfilerOverlay((CANVAS_X_POSITION + 5, CANVAS_Y_POSITION + 5))
 
-        spawn_rate = GAME_SETTINGS.get("easy").get("spawn_rate") 
+        clock = pygame.time.Clock()
 
-        spawn_rate_increase = (max_spawn_rate - spawn_rate) / 600 
+        timestep = FixedTimestep(self.tick_rate, MAX_SIMULATION_STEPS_PER_FRAME)
 
         while running:
-            clock.tick(60)
-
-            # Clear the quadtree
-            self.quadtree.clear()
-            del self.quadtree
-
-            # Build the quadtree
-            self.quadtree = Quadtree(self.window, self.quadtree_boundaries, 2)
+            elapsed = clock.tick(FRAME_RATE)
 
-            # Insert the points into the quadtree
-            for point in self.point_list:
-                self.quadtree.insert(point)
+            # The simulation keeps running while a point spawns
+            for _ in range(timestep.advance(elapsed)):
+                if self.finished():
+                    break
+                self.step()
 
-            # Clear the window
-            self.window.fill((0, 0, 0))
+            # Show the positions at the collision, interpolate otherwise
+            self.point_buffer.alpha = self.impact_time if self.collision_point else timestep.alpha
 
             # Calculate FPS
             fps = clock.get_fps()
 
-            # Calculate the elapsed time
-            elapsed_ticks = pygame.time.get_ticks() - self.start_ticks
-            elapsed_seconds = elapsed_ticks // 1000  # Convert milliseconds to seconds
+            # Simulated time, the same however fast the game ran
+            elapsed_seconds = self.elapsed_seconds()
             score = elapsed_seconds * len(self.point_list)
 
-            self.draw_hud(font, fps, elapsed_seconds, score, font_score)
-
-
-            current_time = time.time()
-            elapsed_time = current_time - last_spawn_time
-
-            if game_state == GameState.PLAYING:
-                self.draw_canvas_border()
-
-                self.quadtree.draw()
-
-                for point in self.point_list:
-                    self.collision_point = self.check_collision(point) or self.collision_point
-
-                self.window.blit(self.crt_texture, (0, 0), special_flags = pygame.BLEND_ALPHA_SDL2)
-
-                self.window.blit(self.hud_image, (0, 0))
-
-                pygame.display.update()
-
-                if self.collision_point:
-                    self.game_over = GameOver(self.window, self.collision_point)
-                    game_over_command = self.game_over.run()
-                    return game_over_command
-                
-                if elapsed_time >= 10/spawn_rate:  # It's time to spawn a new point
-                    game_state = GameState.SPAWNING
-                    last_spawn_time = current_time  # Reset the last spawn time
-                    spawn_rate = min(max_spawn_rate, spawn_rate + spawn_rate_increase * elapsed_time)
-                
-            elif game_state == GameState.SPAWNING:
-                new_point = self.spawn_point()
-                self.point_list.append(new_point)
-                game_state = GameState.PLAYING
-
+            self.profiler.count("checks", self.checks_per_frame)
+            self.profiler.start("hud")
+            self.update_hud(fps, elapsed_seconds, score)
+            self.profiler_overlay.update(self.profiler)
+            self.profiler.stop("hud")
+
+            sprite_positions = self.point_renderer.sprite_positions(self.point_buffer)
+
+            # The game over screen updates the whole window, so the frame of
+            # the collision is drawn whole
+            dirty = None
+            if self.dirty_rects is not None and not self.collision_point:
+                dirty = self.dirty_rects.collect_frame(
+                    sprite_positions,
+                    self.point_renderer.sprite_size,
+                    self.hud,
+                    self.broadphase,
+                    self.profiler_overlay,
+                )
+
+            clear_window(self.window, dirty)
+
+            self.profiler.start("hud")
+            self.draw_hud()
+            self.profiler.stop("hud")
+
+            self.draw_canvas_border()
+
+            self.profiler.start("tree_draw")
+            self.broadphase.draw(draw_points=False)
+            self.profiler.stop("tree_draw")
+
+            self.profiler.start("points_draw")
+            self.point_renderer.draw(self.window, self.point_buffer, sprite_positions)
+            self.profiler.stop("points_draw")
+
+            self.profiler_overlay.draw(self.window)
+
+            self.profiler.start("display")
+            if dirty is None:
+                self.window.blit(self.overlay, (0, 0), special_flags = pygame.BLEND_PREMULTIPLIED)
+            else:
+                # The CRT effect and the HUD frame are blended only where
+                # something changed
+                for rect in dirty:
+                    self.window.blit(self.overlay, rect, rect, special_flags = pygame.BLEND_PREMULTIPLIED)
+            update_display(dirty)
+            self.profiler.stop("display")
+
+            self.profiler.end_frame(self.broadphase)
+
+            if self.started_at is not None:
+                logging.info(f"Game ready in {(time.perf_counter() - self.started_at) * 1000:.0f} ms")
+                self.started_at = None
+
+            if self.collision_point:
+                self.profiler_overlay.close(self.profiler)
+                self.close()
+                self.game_over = GameOver(self.window, self.collision_point)
+                game_over_command = self.game_over.run()
+                return game_over_command
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.profiler_overlay.close(self.profiler)
+                    self.close()
                     pygame.quit()
                     return
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.profiler = self.profiler_overlay.toggle(self.profiler, self.broadphase)
                 elif event.type == pygame.MOUSEBUTTONDOWN:
-                    mouse_pos = pygame.mouse.get_pos()
-                    clicked_region = Rectangle(mouse_pos[0] - Point.danger_radius, mouse_pos[1] - Point.danger_radius, 
-                                            2 * Point.danger_radius, 2 * Point.danger_radius)
-                    points_in_clicked_region = self.quadtree.query_range(clicked_region)
-                    for point in points_in_clicked_region:
-                        if point.is_within_danger_radius(mouse_pos):
-                            point.invert_velocity()
+                    self.click(pygame.mouse.get_pos())
 
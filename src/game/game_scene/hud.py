@@ -0,0 +1,105 @@
+import numpy as np
+import pygame
+
+
+class TextCache:
+    # Rendered texts by their string. HUD counters keep showing the same few
+    # values, so most frames only look them up.
+    def __init__(self, font, color, max_size=512):
+        self.font = font
+        self.color = color
+        self.max_size = max_size
+        self.surfaces = {}
+
+    def render(self, text):
+        surface = self.surfaces.get(text)
+        if surface is None:
+            # Drop the oldest text once full, counters like the score never repeat
+            if len(self.surfaces) >= self.max_size:
+                del self.surfaces[next(iter(self.surfaces))]
+
+            surface = self.font.render(text, True, self.color)
+            self.surfaces[text] = surface
+
+        return surface
+
+
+class HudField:
+    def __init__(self, cache, position):
+        self.cache = cache
+        self.position = position
+        self.text = None
+        self.surface = None
+        self.rect = None
+
+
+class HudLayer:
+    # Text fields drawn at fixed positions, re-rendered only when their text
+    # changes. With track_changes, the regions of the fields that changed are
+    # kept until read, for the dirty rect tracking.
+    def __init__(self, track_changes=False):
+        self.fields = {}
+        self.caches = {}
+        self.track_changes = track_changes
+        self.changed_rects = []
+
+    def add_field(self, name, font, color, position):
+        cache = self.caches.get((font, color))
+        if cache is None:
+            cache = self.caches[(font, color)] = TextCache(font, color)
+
+        self.fields[name] = HudField(cache, position)
+
+    def set(self, name, text):
+        field = self.fields[name]
+        if text == field.text:
+            return
+
+        # Both where the old text was and where the new one goes changed
+        if self.track_changes and field.rect is not None:
+            self.changed_rects.append(field.rect)
+
+        field.text = text
+        field.surface = field.cache.render(text)
+        field.rect = field.surface.get_rect(topleft=field.position)
+
+        if self.track_changes:
+            self.changed_rects.append(field.rect)
+
+    def pop_changed_rects(self):
+        changed_rects = self.changed_rects
+        self.changed_rects = []
+        return changed_rects
+
+    def draw(self, window):
+        window.blits(
+            [
+                (field.surface, field.position)
+                for field in self.fields.values()
+                if field.surface is not None
+            ],
+            doreturn=False,
+        )
+
+
+def composite_overlays(layers):
+    # Merges overlay surfaces, given bottom to top as (surface, opacity), into
+    # one surface with premultiplied alpha. Blitting it with BLEND_PREMULTIPLIED
+    # gives the same result as blitting every layer in turn, in a single blit.
+    width, height = layers[0][0].get_size()
+    color = np.zeros((width, height, 3), dtype=np.float64)
+    alpha = np.zeros((width, height), dtype=np.float64)
+
+    for surface, opacity in layers:
+        layer_color = pygame.surfarray.array3d(surface).astype(np.float64)
+        layer_alpha = pygame.surfarray.array_alpha(surface) / 255 * (opacity / 255)
+
+        # Porter-Duff "over", on premultiplied colors
+        color = layer_color * layer_alpha[..., None] + color * (1 - layer_alpha[..., None])
+        alpha = layer_alpha + alpha * (1 - layer_alpha)
+
+    overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+    pygame.surfarray.pixels3d(overlay)[...] = np.rint(color).astype(np.uint8)
+    pygame.surfarray.pixels_alpha(overlay)[...] = np.rint(alpha * 255).astype(np.uint8)
+
+    return overlay
@@ -1,6 +1,7 @@
 import math
 import random
 import logging
+import time
 
 import pygame
 from pygame.locals import *
@@ -14,8 +15,8 @@ from src.config import (
     NUMBER_OF_POINTS,
     WINDOW_HEIGHT,
     WINDOW_WIDTH,
-    ASSETS_DIR
 )
+from src.assets import assets
 from src.game.quadtree import Quadtree, Rectangle, Point
 
 
@@ -33,9 +34,11 @@ class Button():
 
 
 class MenuScene:
-    def __init__(self, window):
+    def __init__(self, window, started_at=None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+
         self.window = window
-        self.menu_background = pygame.image.load(ASSETS_DIR + f'menu_{random.randint(1, 2)}.png').convert_alpha()
+        self.menu_background = assets.image(f'menu_{random.randint(1, 2)}.png')
         
     def run(self):
         clock = pygame.time.Clock()
@@ -48,6 +51,10 @@ class MenuScene:
 
             pygame.display.update()
 
+            if self.started_at is not None:
+                logging.info(f"Menu ready in {(time.perf_counter() - self.started_at) * 1000:.0f} ms")
+                self.started_at = None
+
             easy_button = Button(155, 547, 250, 100, 'easy')
             medium_button = Button(500, 547, 250, 100, 'medium')
             hard_button = Button(840, 547, 250, 100, 'hard')
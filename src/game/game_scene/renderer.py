@@ -0,0 +1,97 @@
+import numpy as np
+import pygame
+
+from src.game.quadtree import Point, PointBuffer
+
+
+class PointRenderer:
+    # Every look of a point is drawn once into a sprite, then all points are
+    # blitted in a single batch per frame instead of three circles each
+    NORMAL = 0
+    COLLIDING = 1
+    SPAWN = 2
+
+    # Not used by any look, marks the transparent pixels of the sprites
+    COLOR_KEY = (0, 0, 0)
+
+    def __init__(self):
+        self.half_size = Point.danger_radius + 1
+        self.sprite_size = 2 * self.half_size
+        self.sprites = None
+
+    def create_sprite(self, look):
+        size = self.sprite_size
+        center = (self.half_size, self.half_size)
+
+        # Sprites are only solid circles and rings, so a color key is enough
+        # for transparency and, run-length encoded, blits much faster than
+        # per-pixel alpha
+        sprite = pygame.Surface((size, size))
+        sprite.fill(self.COLOR_KEY)
+
+        # Same circles, in the same order, as Point.draw, Point.draw_spawn
+        # and Point.collide
+        if look == self.SPAWN:
+            pygame.draw.circle(sprite, (155, 0, 0), center, 20)
+        else:
+            pygame.draw.circle(sprite, (0, 255, 0), center, 2)
+
+        pygame.draw.circle(sprite, (255, 0, 0), center, Point.collision_radius, 1)
+        pygame.draw.circle(sprite, (0, 100, 0), center, Point.danger_radius, 1)
+
+        if look == self.COLLIDING:
+            pygame.draw.circle(sprite, (255, 0, 255), center, 4)
+
+        # Converted to the display format when there is one, for faster blits
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert()
+
+        sprite.set_colorkey(self.COLOR_KEY, pygame.RLEACCEL)
+        return sprite
+
+    def get_sprites(self):
+        # Built on first use, once pygame and the display are initialized
+        if self.sprites is None:
+            self.sprites = [
+                self.create_sprite(look)
+                for look in (self.NORMAL, self.COLLIDING, self.SPAWN)
+            ]
+
+        return self.sprites
+
+    def sprite_positions(self, buffer):
+        # Top left corners of the sprites of every point in the buffer, at
+        # their interpolated positions, as arrays
+        size = buffer.size
+        alpha = buffer.alpha
+        previous_x = buffer.previous_x[:size]
+        previous_y = buffer.previous_y[:size]
+
+        left = np.rint(previous_x + (buffer.x[:size] - previous_x) * alpha).astype(int)
+        top = np.rint(previous_y + (buffer.y[:size] - previous_y) * alpha).astype(int)
+
+        return left - self.half_size, top - self.half_size
+
+    def draw(self, window, buffer, positions=None):
+        size = buffer.size
+        if size == 0:
+            return
+
+        left, top = positions if positions is not None else self.sprite_positions(buffer)
+
+        # Look of every point, indexing the sprites list
+        flags = buffer.flags[:size]
+        looks = np.where(
+            flags & PointBuffer.FLAG_SPAWNING,
+            self.SPAWN,
+            np.where(flags & PointBuffer.FLAG_COLLIDING, self.COLLIDING, self.NORMAL),
+        )
+
+        sprites = self.get_sprites()
+        window.blits(
+            [
+                (sprites[look], (x, y))
+                for x, y, look in zip(left.tolist(), top.tolist(), looks.tolist())
+            ],
+            doreturn=False,
+        )
@@ -0,0 +1,25 @@
+class FixedTimestep:
+    def __init__(self, tick_rate, max_steps_per_frame):
+        self.step_duration = 1000 / tick_rate
+        self.max_steps_per_frame = max_steps_per_frame
+        self.accumulator = 0.0
+
+    def advance(self, elapsed_ms):
+        # Number of simulation steps due after elapsed_ms of real time
+        self.accumulator += elapsed_ms
+        steps = int(self.accumulator // self.step_duration)
+
+        # When a frame takes too long the backlog is dropped instead of
+        # making the next frames even slower trying to catch up
+        if steps > self.max_steps_per_frame:
+            steps = self.max_steps_per_frame
+            self.accumulator %= self.step_duration
+        else:
+            self.accumulator -= steps * self.step_duration
+
+        return steps
+
+    @property
+    def alpha(self):
+        # Fraction of a step left over, used to interpolate rendering
+        return self.accumulator / self.step_duration
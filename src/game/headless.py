@@ -0,0 +1,217 @@
+import hashlib
+import random
+import time
+
+from src.config import QUADTREE_CAPACITY, QUADTREE_MAX_DEPTH
+from src.game.game_scene.demo import DemoGameScene
+from src.game.game_scene.game import GameScene
+from src.game.trajectory import TrajectoryExporter
+
+PHASES = ("move", "broadphase", "collisions")
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values):
+    ordered = sorted(values)
+    return {
+        "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+        "p50": percentile(ordered, 0.50),
+        "p90": percentile(ordered, 0.90),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+
+def run_headless(
+    number_of_points,
+    frames,
+    seed,
+    broadphase,
+    tick_rate,
+    workers=1,
+    ccd=False,
+    quadtree_capacity=QUADTREE_CAPACITY,
+    quadtree_max_depth=QUADTREE_MAX_DEPTH,
+    profiler=None,
+    trajectory_path=None,
+):
+    # Runs the demo simulation with no window and no frame cap
+    random.seed(seed)
+
+    setup_start = time.perf_counter()
+    scene = DemoGameScene(
+        None,
+        broadphase,
+        number_of_points,
+        tick_rate,
+        workers,
+        ccd,
+        quadtree_capacity=quadtree_capacity,
+        quadtree_max_depth=quadtree_max_depth,
+        profiler=profiler,
+    )
+    setup_time = time.perf_counter() - setup_start
+
+    # Positions and collisions of every frame, streamed to disk
+    exporter = None
+    if trajectory_path is not None:
+        exporter = TrajectoryExporter(trajectory_path)
+
+    phase_times = {phase: [] for phase in PHASES}
+    frame_times = []
+    checks = []
+    collisions = []
+
+    run_start = time.perf_counter()
+
+    for frame in range(frames):
+        # The same step the demo runs, which times its phases
+        scene.simulate()
+
+        for phase, elapsed in zip(PHASES, scene.step_times):
+            phase_times[phase].append(elapsed)
+        frame_times.append(sum(scene.step_times))
+
+        checks.append(scene.checks_per_frame)
+        collisions.append(len(scene.colliding_points) // 2)
+
+        # Written after the frame is timed, it does not count in its time
+        if exporter is not None:
+            exporter.write_tick(frame, scene.point_buffer)
+            exporter.write_collisions(
+                frame, zip(scene.colliding_points[0::2], scene.colliding_points[1::2])
+            )
+
+        scene.profiler.count("checks", scene.checks_per_frame)
+        scene.profiler.end_frame(scene.broadphase)
+        scene.checks_per_frame = 0
+
+    total_time = time.perf_counter() - run_start
+    scene.close()
+    if exporter is not None:
+        exporter.close()
+
+    to_ms = lambda values: [value * 1000 for value in values]
+
+    return {
+        "points": len(scene.point_list),
+        "frames": frames,
+        "seed": seed,
+        "broadphase": broadphase,
+        "tick_rate": tick_rate,
+        "workers": workers,
+        "ccd": ccd,
+        # With "auto", the capacity the tuning ended up with
+        "quadtree_capacity": scene.broadphase.capacity if broadphase == "quadtree" else None,
+        "quadtree_max_depth": quadtree_max_depth,
+        "setup_ms": setup_time * 1000,
+        "total_ms": total_time * 1000,
+        "phases_ms": {
+            phase: dict(summarize(to_ms(times)), total=sum(times) * 1000)
+            for phase, times in phase_times.items()
+        },
+        "frame_time_ms": summarize(to_ms(frame_times)),
+        "checks_per_frame": summarize(checks),
+        "collisions_per_frame": summarize(collisions),
+        "throughput": {
+            "frames_per_second": frames / total_time if total_time else 0.0,
+            "point_updates_per_second": (
+                frames * len(scene.point_list) / total_time if total_time else 0.0
+            ),
+            "checks_per_second": sum(checks) / total_time if total_time else 0.0,
+        },
+    }
+
+
+def state_digest(point_buffer):
+    # Positions and velocities of every point, to tell two runs apart
+    size = point_buffer.size
+    digest = hashlib.sha256()
+    for name in ("x", "y", "vx", "vy"):
+        digest.update(getattr(point_buffer, name)[:size].tobytes())
+    return digest.hexdigest()
+
+
+def run_replay(
+    replay,
+    broadphase,
+    quadtree_capacity=QUADTREE_CAPACITY,
+    quadtree_max_depth=QUADTREE_MAX_DEPTH,
+    profiler=None,
+    trajectory_path=None,
+    kinetic=False,
+):
+    # Plays a recorded game with no window, every tick as fast as it runs,
+    # so the same late game ticks can be timed again and again
+    setup_start = time.perf_counter()
+    scene = GameScene(
+        None,
+        replay.difficulty,
+        broadphase,
+        quadtree_capacity=quadtree_capacity,
+        quadtree_max_depth=quadtree_max_depth,
+        profiler=profiler,
+        replay=replay,
+        kinetic=kinetic,
+    )
+    setup_time = time.perf_counter() - setup_start
+
+    exporter = None
+    if trajectory_path is not None:
+        exporter = TrajectoryExporter(trajectory_path)
+
+    tick_times = []
+    checks = []
+
+    run_start = time.perf_counter()
+
+    while not scene.finished():
+        tick_start = time.perf_counter()
+        scene.step()
+        tick_times.append(time.perf_counter() - tick_start)
+
+        if exporter is not None:
+            exporter.write_tick(scene.tick - 1, scene.point_buffer)
+            if scene.collision_pair is not None:
+                exporter.write_collisions(scene.tick - 1, [scene.collision_pair])
+
+        checks.append(scene.checks_per_frame)
+        scene.profiler.count("checks", scene.checks_per_frame)
+        scene.profiler.end_frame(scene.broadphase)
+        scene.checks_per_frame = 0
+
+    total_time = time.perf_counter() - run_start
+    if exporter is not None:
+        exporter.close()
+
+    to_ms = lambda values: [value * 1000 for value in values]
+
+    return {
+        "difficulty": replay.difficulty,
+        "seed": replay.seed,
+        "broadphase": broadphase,
+        "tick_rate": scene.tick_rate,
+        "ccd": replay.ccd,
+        "kinetic": scene.kinetic is not None,
+        "ticks": scene.tick,
+        "collision": bool(scene.collision_point),
+        "points": len(scene.point_list),
+        "score": scene.elapsed_seconds() * len(scene.point_list),
+        "state": state_digest(scene.point_buffer),
+        "setup_ms": setup_time * 1000,
+        "total_ms": total_time * 1000,
+        "tick_time_ms": summarize(to_ms(tick_times)),
+        # The slowest ticks, to profile the same ones again
+        "slowest_ticks": sorted(
+            range(len(tick_times)), key=tick_times.__getitem__, reverse=True
+        )[:10],
+        "checks_per_tick": summarize(checks),
+    }
@@ -1,18 +1,62 @@
+import json
 import logging
+import os
+import time
+
+# Start of the launch, for the time until the first scene shows up
+LAUNCH_TIME = time.perf_counter()
+
+# Keeps stdout clean for the --headless JSON report
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
 
-import moderngl
 import pygame
 import argparse
 from pygame.locals import *
 
-from src.config import WINDOW_WIDTH, WINDOW_HEIGHT
+from src.config import (
+    WINDOW_WIDTH,
+    WINDOW_HEIGHT,
+    DEFAULT_BROADPHASE,
+    NUMBER_OF_POINTS,
+    SIMULATION_TICK_RATE,
+    CCD_TICK_RATE,
+    QUADTREE_CAPACITY,
+    QUADTREE_MAX_DEPTH,
+)
 from src.game.game_scene.demo import DemoGameScene
 from src.game.game_scene.game import GameScene
 from src.game.game_scene.menu_scene import MenuScene
+from src.game.quadtree.broadphase import BROADPHASES
+from src.game.profiler import FrameProfiler
+from src.game.replay import Replay
+from src.game.quadtree.tuning import AUTO_CAPACITY
 
 logging.basicConfig(level=logging.INFO)
 
 
+def capacity_option(value):
+    # A fixed quadtree capacity, or "auto" to tune it while running
+    if value == AUTO_CAPACITY:
+        return value
+    return int(value)
+
+
+def seed_option(value):
+    # Game logs store the seed in 64 bits
+    seed = int(value)
+    if not 0 <= seed < 2 ** 64:
+        raise argparse.ArgumentTypeError(f"seed must be between 0 and 2**64 - 1, got {seed}")
+    return seed
+
+
+def record_path(path, game):
+    # Every game played in a session gets its own log, the first one the
+    # path itself and the retries numbered after it
+    if path is None or game == 1:
+        return path
+    return f"{path}.{game}"
+
+
 def main():
     logging.info("Initializing pygame...")
 
@@ -20,25 +64,134 @@ def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--demo', action='store_true')
+    parser.add_argument('--broadphase', choices=BROADPHASES, default=DEFAULT_BROADPHASE)
+    parser.add_argument('--tick-rate', type=int)
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--points', type=int, default=NUMBER_OF_POINTS)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--seed', type=seed_option)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--ccd', action='store_true')
+    parser.add_argument('--dirty-rects', action='store_true')
+    parser.add_argument('--capacity', type=capacity_option, default=QUADTREE_CAPACITY)
+    parser.add_argument('--max-depth', type=int, default=QUADTREE_MAX_DEPTH)
+    parser.add_argument('--profile', metavar='PATH')
+    parser.add_argument('--record', metavar='PATH')
+    parser.add_argument('--replay', metavar='PATH')
+    parser.add_argument('--trajectory', metavar='PATH')
+    parser.add_argument('--kinetic', action='store_true')
     args = parser.parse_args()
 
+    # Continuous collision detection allows a much lower default tick rate
+    if args.tick_rate is None:
+        args.tick_rate = CCD_TICK_RATE if args.ccd else SIMULATION_TICK_RATE
+
+    # Every frame timed phase by phase and written to the file, as CSV if it
+    # ends in .csv and as JSON lines otherwise
+    profiler = None
+    if args.profile:
+        profiler = FrameProfiler(args.profile)
+
+    # A recorded game, played instead of the menu and the player's input
+    replay = None
+    if args.replay:
+        replay = Replay(args.replay)
+
+    # Benchmark the demo simulation, or play a recorded game, without a
+    # display and report it as JSON
+    if args.headless and replay is not None:
+        from src.game.headless import run_replay
+
+        report = run_replay(
+            replay,
+            args.broadphase,
+            args.capacity,
+            args.max_depth,
+            profiler,
+            args.trajectory,
+            args.kinetic,
+        )
+        if profiler is not None:
+            profiler.close()
+        print(json.dumps(report, indent=2))
+        return
+
+    if args.headless:
+        from src.game.headless import run_headless
+
+        report = run_headless(
+            args.points,
+            args.frames,
+            0 if args.seed is None else args.seed,
+            args.broadphase,
+            args.tick_rate,
+            args.workers,
+            args.ccd,
+            args.capacity,
+            args.max_depth,
+            profiler,
+            args.trajectory,
+        )
+        if profiler is not None:
+            profiler.close()
+        print(json.dumps(report, indent=2))
+        return
+
     # true if --demo, false if not
     demo = args.demo
+    # Games started so far, each one recorded to its own file
+    games = 0
 
     try:
         pygame.init()
 
         window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
 
+        # The first scene logs how long it took to show up since the launch
+        started_at = LAUNCH_TIME
+
         while True:
             if demo:
-                game_scene = DemoGameScene(window)
+                game_scene = DemoGameScene(
+                    window,
+                    args.broadphase,
+                    tick_rate=args.tick_rate,
+                    workers=args.workers,
+                    ccd=args.ccd,
+                    dirty_rects=args.dirty_rects,
+                    started_at=started_at,
+                    quadtree_capacity=args.capacity,
+                    quadtree_max_depth=args.max_depth,
+                    profiler=profiler,
+                )
             else:
-                if game_over_command == 'menu':
-                    menu = MenuScene(window)
+                if replay is not None:
+                    difficulty = replay.difficulty
+                elif game_over_command == 'menu':
+                    menu = MenuScene(window, started_at)
+
+                    # The game assets are built while the player picks a difficulty
+                    GameScene.preload_assets()
+
                     difficulty = menu.run()
-                game_scene = GameScene(window, difficulty)
+                games += 1
+                game_scene = GameScene(
+                    window,
+                    difficulty,
+                    args.broadphase,
+                    args.tick_rate,
+                    args.ccd,
+                    args.dirty_rects,
+                    quadtree_capacity=args.capacity,
+                    quadtree_max_depth=args.max_depth,
+                    profiler=profiler,
+                    seed=args.seed,
+                    record_path=record_path(args.record, games),
+                    replay=replay,
+                    kinetic=args.kinetic,
+                )
     
+            started_at = None
             game_over_command = game_scene.run()
             
 
@@ -48,6 +201,10 @@ def main():
         pygame.quit()
         raise e
 
+    finally:
+        if profiler is not None:
+            profiler.close()
+
 
 if __name__ == "__main__":
     logging.info("Starting game...")
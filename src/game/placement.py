@@ -0,0 +1,144 @@
+import logging
+import math
+import random
+
+import numpy as np
+
+# Candidates drawn per empty cell. Past a dozen rounds barely any point fits
+# anymore and the area is about as full as Bridson's algorithm leaves it.
+ROUNDS = 16
+
+
+class SpacingGrid:
+    # Grid index with cells small enough to hold a single point when points
+    # are at least spacing apart, so a neighbor check looks at a few cells
+    def __init__(self, area, spacing):
+        self.area = area
+        self.spacing = spacing
+        self.cell_size = spacing / math.sqrt(2)
+        self.columns = int(area.width / self.cell_size) + 1
+        self.rows = int(area.height / self.cell_size) + 1
+        self.cells = [None] * (self.columns * self.rows)
+
+    def cell_of(self, x, y):
+        column = min(self.columns - 1, int((x - self.area.x) / self.cell_size))
+        row = min(self.rows - 1, int((y - self.area.y) / self.cell_size))
+        return column, row
+
+    def fits(self, x, y):
+        area = self.area
+        if not (area.x <= x <= area.x + area.width and area.y <= y <= area.y + area.height):
+            return False
+
+        column, row = self.cell_of(x, y)
+        columns = self.columns
+        cells = self.cells
+        squared_spacing = self.spacing * self.spacing
+
+        # Points closer than spacing can only be up to two cells away
+        for neighbor_row in range(max(0, row - 2), min(self.rows, row + 3)):
+            offset = neighbor_row * columns
+            for neighbor_column in range(max(0, column - 2), min(columns, column + 3)):
+                position = cells[offset + neighbor_column]
+                if position is not None:
+                    dx = position[0] - x
+                    dy = position[1] - y
+                    if dx * dx + dy * dy < squared_spacing:
+                        return False
+
+        return True
+
+    def add(self, x, y):
+        column, row = self.cell_of(x, y)
+        self.cells[row * self.columns + column] = (x, y)
+
+
+def fill_area(area, spacing, rng=random, rounds=ROUNDS):
+    # Poisson-disk sampling on a grid of cells small enough to hold a single
+    # point, so each point only has to be checked against the cells around
+    # it. Instead of growing the points one by one from a seed like Bridson's
+    # algorithm, every empty cell draws a candidate at once: cells three apart
+    # in both directions cannot hold points closer than spacing, so they are
+    # drawn in nine interleaved groups, each checked as a whole with numpy.
+    generator = np.random.default_rng(rng.getrandbits(64))
+
+    cell_size = spacing / math.sqrt(2)
+    columns = max(1, math.ceil(area.width / cell_size))
+    rows = max(1, math.ceil(area.height / cell_size))
+
+    # Two cells of padding around, so the neighbors never go out of bounds
+    xs = np.full((rows + 4, columns + 4), np.nan)
+    ys = np.full((rows + 4, columns + 4), np.nan)
+
+    # Cells up to two apart can hold points closer than spacing, except for
+    # the diagonal corners
+    neighbors = [
+        (row_offset, column_offset)
+        for row_offset in range(-2, 3)
+        for column_offset in range(-2, 3)
+        if (row_offset, column_offset) != (0, 0) and abs(row_offset) + abs(column_offset) < 4
+    ]
+
+    squared_spacing = spacing * spacing
+
+    for _ in range(rounds):
+        for group in generator.permutation(9):
+            first_row, first_column = divmod(int(group), 3)
+            cells = xs[2 + first_row : 2 + rows : 3, 2 + first_column : 2 + columns : 3]
+            row, column = np.nonzero(np.isnan(cells))
+            row = row * 3 + first_row + 2
+            column = column * 3 + first_column + 2
+
+            x = area.x + (column - 2 + generator.random(len(column))) * cell_size
+            y = area.y + (row - 2 + generator.random(len(row))) * cell_size
+
+            # The last cells stick out of the area
+            fits = (x <= area.x + area.width) & (y <= area.y + area.height)
+
+            for row_offset, column_offset in neighbors:
+                dx = xs[row + row_offset, column + column_offset] - x
+                dy = ys[row + row_offset, column + column_offset] - y
+                # Empty cells are NaN, which never compares as too close
+                fits &= ~(dx * dx + dy * dy < squared_spacing)
+
+            xs[row[fits], column[fits]] = x[fits]
+            ys[row[fits], column[fits]] = y[fits]
+
+    filled = ~np.isnan(xs)
+    return xs[filled], ys[filled]
+
+
+def poisson_disk_positions(amount, area, spacing, rng=random):
+    # Exactly amount positions inside area, at least spacing apart. The area
+    # is filled whole and amount positions are picked from it at random, so
+    # they spread over all of it. When they cannot fit, the spacing shrinks.
+    if amount <= 0:
+        return []
+
+    while True:
+        xs, ys = fill_area(area, spacing, rng)
+        if len(xs) >= amount:
+            chosen = rng.sample(range(len(xs)), amount)
+            return list(zip(xs[chosen].tolist(), ys[chosen].tolist()))
+
+        # The number of points that fit grows with 1 / spacing²
+        smaller_spacing = spacing * math.sqrt(len(xs) / amount) * 0.95
+        logging.warning(
+            f"{amount} points do not fit {spacing:.2f} apart in {area}, "
+            f"placing them {smaller_spacing:.2f} apart"
+        )
+        spacing = smaller_spacing
+
+
+def keep_spaced(positions, area, spacing):
+    # The positions inside area that are at least spacing away from every
+    # position kept before them, in their original order
+    grid = SpacingGrid(area, spacing)
+    kept = []
+
+    for x, y in positions:
+        if grid.fits(x, y):
+            grid.add(x, y)
+            kept.append((x, y))
+
+    return kept
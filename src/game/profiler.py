@@ -0,0 +1,370 @@
+import collections
+import csv
+import functools
+import inspect
+import json
+import time
+
+import pygame
+
+from src.game.quadtree import Quadtree
+
+# Parts of a frame timed by the scenes
+PHASES = ("move", "tree_update", "collisions", "tree_draw", "points_draw", "hud", "display")
+
+# Broad phase operations timed inside those phases. Subdivisions happen in
+# inserts and count in both, the narrow phase is the time spent on the
+# pairs the pair search yields.
+OPERATIONS = ("insert", "subdivide", "query", "pair_search", "narrow_phase")
+
+COUNTERS = (
+    "inserts",
+    "subdivisions",
+    "rebuilds",
+    "range_queries",
+    "node_visits",
+    "nodes_allocated",
+    "checks",
+    "nodes",
+    "depth",
+)
+
+# Broad phase methods counted while profiling, with the counter each call
+# adds to and the operation its time goes to. Recursive calls count too, so
+# inserts are the nodes an insert went through and node_visits the nodes the
+# pair search went through, but only the outermost call is timed.
+HOOKS = (
+    ("insert", "inserts", 1, "insert"),
+    ("subdivide", "subdivisions", 1, "subdivide"),
+    ("bulk_load", "rebuilds", 1, None),
+    ("iter_range", "range_queries", 1, "query"),
+    ("query_circle", "range_queries", 1, "query"),
+    ("nearest", "range_queries", 1, "query"),
+    ("find_all_pairs", "node_visits", 1, "pair_search"),
+    ("find_pairs_between", "node_visits", 1, None),
+    ("create_children", "nodes_allocated", 4, None),
+)
+
+
+class NullProfiler:
+    # Used while not profiling, every hook does nothing
+    enabled = False
+
+    def start(self, phase):
+        pass
+
+    def stop(self, phase):
+        pass
+
+    def count(self, counter, amount=1):
+        pass
+
+    def attach(self, broadphase):
+        pass
+
+    def end_frame(self, tree=None):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class FrameProfiler:
+    # Times the phases of every frame and counts and times the broad phase
+    # work done in it. Only the broad phase attached to the profiler is
+    # hooked, so it and any other one run untouched otherwise. Frames are
+    # written to path, as CSV if it ends in .csv and as JSON lines otherwise.
+    enabled = True
+
+    def __init__(self, path=None, history=60):
+        self.frame = 0
+        self.started_at = time.perf_counter()
+
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.phase_starts = {}
+        self.operation_times = dict.fromkeys(OPERATIONS, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+        # Operations being timed, calls nested in them are not timed again
+        self.running = set()
+
+        # Last frames, for the overlay
+        self.history = collections.deque(maxlen=history)
+
+        self.file = None
+        self.csv_writer = None
+        if path is not None:
+            # Line buffered, so the frames are on disk even if the game crashes
+            self.file = open(path, "w", newline="", buffering=1)
+            if path.endswith(".csv"):
+                self.csv_writer = csv.writer(self.file)
+                self.csv_writer.writerow(
+                    ["frame", "time_s"]
+                    + [f"{phase}_ms" for phase in PHASES]
+                    + [f"{operation}_ms" for operation in OPERATIONS]
+                    + list(COUNTERS)
+                )
+
+        # Broad phase being profiled, with its class and the hooked subclass
+        # its nodes are switched to meanwhile
+        self.broadphase = None
+        self.broadphase_class = None
+        self.profiled_classes = {}
+
+    def attach(self, broadphase):
+        if broadphase is self.broadphase:
+            return
+
+        self.detach()
+        self.broadphase = broadphase
+        self.broadphase_class = type(broadphase)
+
+        profiled_class = self.profiled_class(self.broadphase_class)
+        for node in broadphase_nodes(broadphase):
+            node.__class__ = profiled_class
+
+    def detach(self):
+        if self.broadphase is None:
+            return
+
+        for node in broadphase_nodes(self.broadphase):
+            node.__class__ = self.broadphase_class
+
+        self.broadphase = None
+        self.broadphase_class = None
+
+    def profiled_class(self, cls):
+        # Subclass with the hooked methods. Quadtree nodes create their
+        # children with their own class, so the whole tree stays hooked.
+        if cls not in self.profiled_classes:
+            namespace = {"__slots__": ()}
+            for name, counter, amount, operation in HOOKS:
+                if hasattr(cls, name):
+                    namespace[name] = self.hook(getattr(cls, name), counter, amount, operation)
+
+            self.profiled_classes[cls] = type(f"Profiled{cls.__name__}", (cls,), namespace)
+
+        return self.profiled_classes[cls]
+
+    def hook(self, original, counter, amount, operation):
+        if inspect.isgeneratorfunction(original):
+            # Generators run as they are iterated, not when they are called
+            @functools.wraps(original)
+            def hook(*args, **kwargs):
+                self.counters[counter] += amount
+                iterator = original(*args, **kwargs)
+                # Nested in a call being timed already, like the recursion
+                # of the pair search
+                if operation is None or operation in self.running:
+                    return iterator
+                return self.timed_iterator(iterator, operation)
+
+            return hook
+
+        @functools.wraps(original)
+        def hook(*args, **kwargs):
+            self.counters[counter] += amount
+            if operation is None or operation in self.running:
+                return original(*args, **kwargs)
+
+            self.running.add(operation)
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.operation_times[operation] += time.perf_counter() - start
+                self.running.discard(operation)
+
+        return hook
+
+    def timed_iterator(self, iterator, operation):
+        # The time spent producing each item goes to the operation. For the
+        # pair search, the time the caller spends on a pair before asking
+        # for the next one is the narrow phase.
+        while True:
+            outermost = operation not in self.running
+            if outermost:
+                self.running.add(operation)
+                start = time.perf_counter()
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                if outermost:
+                    self.operation_times[operation] += time.perf_counter() - start
+                    self.running.discard(operation)
+
+            yielded = time.perf_counter()
+            yield item
+
+            if outermost and operation == "pair_search":
+                self.operation_times["narrow_phase"] += time.perf_counter() - yielded
+
+    def start(self, phase):
+        self.phase_starts[phase] = time.perf_counter()
+
+    def stop(self, phase):
+        # Phases run more than once per frame (like the simulation steps) add up
+        self.phase_times[phase] += time.perf_counter() - self.phase_starts.pop(phase)
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    def end_frame(self, tree=None):
+        # Size of the tree as the frame ends, for quadtree broad phases
+        if isinstance(tree, Quadtree):
+            self.counters["nodes"], self.counters["depth"] = tree_size(tree)
+
+        record = {
+            "frame": self.frame,
+            "time_s": time.perf_counter() - self.started_at,
+            "phases_ms": {phase: seconds * 1000 for phase, seconds in self.phase_times.items()},
+            "operations_ms": {
+                operation: seconds * 1000 for operation, seconds in self.operation_times.items()
+            },
+            "counters": dict(self.counters),
+        }
+        self.history.append(record)
+
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(
+                [record["frame"], f"{record['time_s']:.6f}"]
+                + [f"{record['phases_ms'][phase]:.4f}" for phase in PHASES]
+                + [f"{record['operations_ms'][operation]:.4f}" for operation in OPERATIONS]
+                + [record["counters"][counter] for counter in COUNTERS]
+            )
+        elif self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+
+        self.frame += 1
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.operation_times = dict.fromkeys(OPERATIONS, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def close(self):
+        self.detach()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def broadphase_nodes(broadphase):
+    # Every node of a quadtree, the structure itself for the other broad phases
+    if not isinstance(broadphase, Quadtree):
+        return [broadphase]
+
+    nodes = []
+    stack = [broadphase]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        if node.divided:
+            stack.extend(node.children())
+
+    return nodes
+
+
+def tree_size(quadtree):
+    # Number of nodes and depth of the deepest one
+    nodes = 0
+    depth = 0
+    stack = [quadtree]
+
+    while stack:
+        node = stack.pop()
+        nodes += 1
+        depth = max(depth, node.depth - quadtree.depth)
+        if node.divided:
+            stack.extend(node.children())
+
+    return nodes, depth
+
+
+class ProfilerOverlay:
+    # Panel toggled with F3: the phase times averaged over the last frames and
+    # the counters of the last one. It is rendered again a few times a
+    # second only, so it costs little itself.
+    REFRESH_FRAMES = 15
+
+    def __init__(self, position):
+        self.position = position
+        self.font = pygame.font.Font(None, 22)
+        self.visible = False
+        self.profiler_started = False
+        self.surface = None
+        self.frames = 0
+
+    def toggle(self, profiler, broadphase):
+        # Returns the profiler to use from now on. Without one given on the
+        # command line, a profiler only runs while the overlay is shown.
+        self.visible = not self.visible
+        self.surface = None
+
+        if self.visible and not profiler.enabled:
+            self.profiler_started = True
+            profiler = FrameProfiler()
+            profiler.attach(broadphase)
+            return profiler
+
+        if not self.visible and self.profiler_started:
+            self.profiler_started = False
+            profiler.close()
+            return NULL_PROFILER
+
+        return profiler
+
+    def close(self, profiler):
+        # Closes the profiler if the overlay is the one that started it
+        if self.profiler_started:
+            self.profiler_started = False
+            profiler.close()
+
+    def render(self, profiler):
+        history = profiler.history
+        lines = [f"Frame profile ({len(history)} frames)"]
+
+        for phase in PHASES:
+            average = sum(record["phases_ms"][phase] for record in history) / max(1, len(history))
+            lines.append(f"{phase}: {average:.2f} ms")
+
+        for operation in OPERATIONS:
+            average = sum(record["operations_ms"][operation] for record in history) / max(1, len(history))
+            lines.append(f"{operation}: {average:.2f} ms")
+
+        if history:
+            for counter, value in history[-1]["counters"].items():
+                lines.append(f"{counter}: {value}")
+
+        line_height = self.font.get_linesize()
+        texts = [self.font.render(line, True, (0, 255, 0)) for line in lines]
+        width = max(text.get_width() for text in texts) + 10
+
+        surface = pygame.Surface((width, line_height * len(texts) + 10), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 200))
+        for i, text in enumerate(texts):
+            surface.blit(text, (5, 5 + i * line_height))
+
+        return surface
+
+    def update(self, profiler):
+        if not self.visible:
+            return
+
+        if self.surface is None or self.frames % self.REFRESH_FRAMES == 0:
+            self.surface = self.render(profiler)
+        self.frames += 1
+
+    def get_rect(self):
+        if not self.visible or self.surface is None:
+            return None
+
+        return self.surface.get_rect(topleft=self.position)
+
+    def draw(self, window):
+        if self.visible and self.surface is not None:
+            window.blit(self.surface, self.position)
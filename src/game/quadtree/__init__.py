@@ -1,7 +1,11 @@
+import bisect
+import heapq
+import itertools
 import random
 import math
 import logging
 
+import numpy as np
 import pygame
 
 from src.config import (
@@ -10,6 +14,8 @@ from src.config import (
     CANVAS_X_POSITION,
     CANVAS_Y_POSITION,
     POINT_RADIUS,
+    QUADTREE_MAX_DEPTH,
+    QUADTREE_REBUILD_FRACTION,
     VELOCITY,
     INVALID_VELOCITIES,
     VELOCITY_MAX_VALUE,
@@ -17,24 +23,187 @@ from src.config import (
 )
 
 
+class PointBuffer:
+    FLAG_ACTIVE = 1
+    FLAG_COLLIDING = 2
+    # Shown with the spawn animation, not moving until it ends
+    FLAG_SPAWNING = 4
+
+    ARRAYS = ("x", "y", "previous_x", "previous_y", "vx", "vy", "radius", "flags")
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.points = []
+
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.previous_x = np.zeros(capacity, dtype=np.float64)
+        self.previous_y = np.zeros(capacity, dtype=np.float64)
+        self.vx = np.zeros(capacity, dtype=np.float64)
+        self.vy = np.zeros(capacity, dtype=np.float64)
+        self.radius = np.zeros(capacity, dtype=np.float64)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+
+        # How far rendering is between the previous and the current step
+        self.alpha = 1.0
+
+    def __len__(self):
+        return self.size
+
+    def grow(self):
+        capacity = max(1, 2 * len(self.x))
+        for name in self.ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+
+    def add(self, point, x, y, velocity, radius):
+        if self.size == len(self.x):
+            self.grow()
+
+        index = self.size
+        self.x[index] = self.previous_x[index] = x
+        self.y[index] = self.previous_y[index] = y
+        self.vx[index], self.vy[index] = velocity
+        self.radius[index] = radius
+        self.flags[index] = self.FLAG_ACTIVE
+
+        self.points.append(point)
+        self.size += 1
+
+        return index
+
+    def step(self, dt=1.0):
+        # dt is measured in ticks of BASE_TICK_RATE, the rate velocities are given in
+        n = self.size
+        x = self.x[:n]
+        y = self.y[:n]
+        vx = self.vx[:n]
+        vy = self.vy[:n]
+        radius = self.radius[:n]
+        active = (self.flags[:n] & self.FLAG_ACTIVE) != 0
+
+        self.previous_x[:n] = x
+        self.previous_y[:n] = y
+
+        x += np.where(active, vx * dt, 0.0)
+        y += np.where(active, vy * dt, 0.0)
+
+        # A point turns around on an axis once its circle reaches past a wall
+        bounce_x = active & (
+            (x - radius < CANVAS_X_POSITION)
+            | (x + radius > CANVAS_X_POSITION + CANVAS_WIDTH)
+        )
+        bounce_y = active & (
+            (y - radius < CANVAS_Y_POSITION)
+            | (y + radius > CANVAS_Y_POSITION + CANVAS_HEIGHT)
+        )
+
+        vx[bounce_x] *= -1
+        vy[bounce_y] *= -1
+
+    def clear_flag(self, flag):
+        self.flags[: self.size] &= ~np.uint8(flag)
+
+
+# Fastest a point can move, in pixels per tick at BASE_TICK_RATE
+MAX_SPEED = math.sqrt(2) * max(abs(VELOCITY_MIN_VALUE), abs(VELOCITY_MAX_VALUE)) * VELOCITY
+
+
 class Point:
+    # Slots instead of a __dict__ per instance, there can be many thousands
+    __slots__ = ("buffer", "index", "node")
+
     collision_radius = POINT_RADIUS
     danger_radius = 2 * POINT_RADIUS
 
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
+    def __init__(self, x, y, buffer=None, velocity=None):
+        # Points created on their own get a private buffer
+        if buffer is None:
+            buffer = PointBuffer(1)
+
+        if velocity is None:
+            velocity = self.get_random_velocity()
+
+        self.buffer = buffer
+        self.index = buffer.add(self, x, y, velocity, self.collision_radius)
+
+        # Leaf of the quadtree that currently holds this point
+        self.node = None
+
+    @property
+    def x(self):
+        return float(self.buffer.x[self.index])
+
+    @x.setter
+    def x(self, value):
+        self.buffer.x[self.index] = value
+
+    @property
+    def y(self):
+        return float(self.buffer.y[self.index])
+
+    @y.setter
+    def y(self, value):
+        self.buffer.y[self.index] = value
+
+    @property
+    def render_position(self):
+        # Position between the last two simulation steps, used for drawing
+        buffer = self.buffer
+        index = self.index
+        alpha = buffer.alpha
+
+        previous_x = buffer.previous_x[index]
+        previous_y = buffer.previous_y[index]
+
+        return (
+            float(previous_x + (buffer.x[index] - previous_x) * alpha),
+            float(previous_y + (buffer.y[index] - previous_y) * alpha),
+        )
+
+    @property
+    def colliding(self):
+        return bool(self.buffer.flags[self.index] & PointBuffer.FLAG_COLLIDING)
+
+    @colliding.setter
+    def colliding(self, value):
+        if value:
+            self.buffer.flags[self.index] |= PointBuffer.FLAG_COLLIDING
+        else:
+            self.buffer.flags[self.index] &= ~np.uint8(PointBuffer.FLAG_COLLIDING)
+
+    @property
+    def spawning(self):
+        return bool(self.buffer.flags[self.index] & PointBuffer.FLAG_SPAWNING)
+
+    @spawning.setter
+    def spawning(self, value):
+        # A spawning point stays still until it becomes active
+        if value:
+            self.buffer.flags[self.index] = PointBuffer.FLAG_SPAWNING
+        else:
+            self.buffer.flags[self.index] = PointBuffer.FLAG_ACTIVE
 
-        self.velocity = self.get_random_velocity()
+    @property
+    def velocity(self):
+        return float(self.buffer.vx[self.index]), float(self.buffer.vy[self.index])
+
+    @velocity.setter
+    def velocity(self, value):
+        self.buffer.vx[self.index], self.buffer.vy[self.index] = value
 
     def draw(self, window):
-        pygame.draw.circle(window, (0, 255, 0), (self.x, self.y), 2)
+        pygame.draw.circle(window, (0, 255, 0), self.render_position, 2)
         self.draw_collision_radius(window)
         self.draw_danger_radius(window)
-        self.move()
+
+        if self.colliding:
+            self.collide(window)
     
     def draw_spawn(self, window):
-        pygame.draw.circle(window, (155, 0, 0), (self.x, self.y), 20)
+        pygame.draw.circle(window, (155, 0, 0), self.render_position, 20)
         self.draw_collision_radius(window)
         self.draw_danger_radius(window)
 
@@ -47,19 +216,19 @@ class Point:
         )
 
     def collide(self, window):
-        pygame.draw.circle(window, (255, 0, 255), (self.x, self.y), 4)
+        pygame.draw.circle(window, (255, 0, 255), self.render_position, 4)
 
     def __str__(self):
         return f"({self.x}, {self.y})"
 
     def draw_danger_radius(self, window):
         pygame.draw.circle(
-            window, (0, 100, 0), (self.x, self.y), self.danger_radius, 1
+            window, (0, 100, 0), self.render_position, self.danger_radius, 1
         )
 
     def draw_collision_radius(self, window):
         pygame.draw.circle(
-            window, (255, 0, 0), (self.x, self.y), self.collision_radius, 1
+            window, (255, 0, 0), self.render_position, self.collision_radius, 1
         )
     
     def is_within_danger_radius(self, pos):
@@ -69,34 +238,27 @@ class Point:
     def invert_velocity(self):
         self.velocity = (-self.velocity[0], -self.velocity[1])
 
-    def get_random_velocity(self):
+    def move_to(self, x, y):
+        # Jumps there, with nothing to interpolate from the old position
+        buffer, index = self.buffer, self.index
+        buffer.x[index] = buffer.previous_x[index] = x
+        buffer.y[index] = buffer.previous_y[index] = y
+
+    @staticmethod
+    def get_random_velocity(rng=random):
         velocity_vector = (0, 0)
         while velocity_vector in INVALID_VELOCITIES:
             velocity_vector = (
-                random.uniform(VELOCITY_MIN_VALUE, VELOCITY_MAX_VALUE),
-                random.uniform(VELOCITY_MIN_VALUE, VELOCITY_MAX_VALUE)
+                rng.uniform(VELOCITY_MIN_VALUE, VELOCITY_MAX_VALUE),
+                rng.uniform(VELOCITY_MIN_VALUE, VELOCITY_MAX_VALUE)
             )
 
         return velocity_vector[0] * VELOCITY, velocity_vector[1] * VELOCITY
 
-    def move(self):
-        self.x += self.velocity[0]
-        self.y += self.velocity[1]
-
-        if (
-            self.x - self.collision_radius < CANVAS_X_POSITION
-            or self.x + self.collision_radius > CANVAS_X_POSITION + CANVAS_WIDTH
-        ):
-            self.velocity = -self.velocity[0], self.velocity[1]
-
-        if (
-            self.y - self.collision_radius < CANVAS_Y_POSITION
-            or self.y + self.collision_radius > CANVAS_Y_POSITION + CANVAS_HEIGHT
-        ):
-            self.velocity = self.velocity[0], -self.velocity[1]
-
 
 class Rectangle:
+    __slots__ = ("x", "y", "width", "height")
+
     def __init__(self, x, y, width, height):
         self.x = x
         self.y = y
@@ -120,88 +282,237 @@ class Rectangle:
             or self.y >= other.y + other.height
         )
 
+    def distance_to_point(self, x, y):
+        dx = max(0, self.x - x, x - (self.x + self.width))
+        dy = max(0, self.y - y, y - (self.y + self.height))
+        return math.hypot(dx, dy)
+
+    def distance_to(self, other):
+        # Length of the gap between both rectangles, 0 when they touch
+        dx = max(0, other.x - (self.x + self.width), self.x - (other.x + other.width))
+        dy = max(0, other.y - (self.y + self.height), self.y - (other.y + other.height))
+        return math.hypot(dx, dy)
+
     def __str__(self):
         return f"({self.x}, {self.y}, {self.width}, {self.height})"
 
 
 class Quadtree:
-    def __init__(self, window, boundary: Rectangle, capacity: int):
+    # The children only exist while the node is divided
+    __slots__ = (
+        "window",
+        "point_list",
+        "boundary",
+        "capacity",
+        "max_depth",
+        "depth",
+        "parent",
+        "divided",
+        "northwest",
+        "northeast",
+        "southwest",
+        "southeast",
+    )
+
+    def __init__(
+        self,
+        window,
+        boundary: Rectangle,
+        capacity: int,
+        parent=None,
+        max_depth: int = QUADTREE_MAX_DEPTH,
+    ):
         self.window = window
         self.point_list = []
         self.boundary = boundary
         self.capacity = capacity
+        self.max_depth = max_depth
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.parent = parent
         self.divided = False
 
     def query_range(self, range: Rectangle):
-        points = []
-
-        if not self.boundary.intersects(range):
-            return points
-
-        for point in self.point_list:
-            if range.contains(point):
-                points.append(point)
-
-        if self.divided:
-            points.extend(self.northwest.query_range(range))
-            points.extend(self.northeast.query_range(range))
-            points.extend(self.southwest.query_range(range))
-            points.extend(self.southeast.query_range(range))
-
-        return points
+        return list(self.iter_range(range))
+
+    def iter_range(self, range: Rectangle):
+        # Explicit stack instead of recursion, so no list is built per node
+        stack = [self]
+
+        while stack:
+            node = stack.pop()
+
+            if not node.boundary.intersects(range):
+                continue
+
+            for point in node.point_list:
+                if range.contains(point):
+                    yield point
+
+            if node.divided:
+                stack.append(node.southeast)
+                stack.append(node.southwest)
+                stack.append(node.northeast)
+                stack.append(node.northwest)
+
+    def query_circle(self, x, y, radius):
+        stack = [self]
+
+        while stack:
+            node = stack.pop()
+
+            # Skip nodes whose closest point is already out of the circle
+            if node.boundary.distance_to_point(x, y) > radius:
+                continue
+
+            for point in node.point_list:
+                if math.hypot(point.x - x, point.y - y) <= radius:
+                    yield point
+
+            if node.divided:
+                stack.append(node.southeast)
+                stack.append(node.southwest)
+                stack.append(node.northeast)
+                stack.append(node.northwest)
+
+    def nearest(self, x, y, k=1, max_distance=math.inf, exclude=None):
+        # The k points closest to (x, y), closest first, up to max_distance.
+        # Best-first search: nodes and points share a priority queue keyed on
+        # their distance, so a point comes out of it only once nothing left
+        # in the queue can be closer, and far nodes are never opened.
+        order = itertools.count()
+        queue = [(self.boundary.distance_to_point(x, y), next(order), self, None)]
+        found = []
+
+        while queue and len(found) < k:
+            distance, _, node, point = heapq.heappop(queue)
+            if distance > max_distance:
+                break
+
+            if point is not None:
+                found.append(point)
+                continue
+
+            for point in node.point_list:
+                if point is not exclude:
+                    distance = math.hypot(point.x - x, point.y - y)
+                    if distance <= max_distance:
+                        heapq.heappush(queue, (distance, next(order), None, point))
+
+            if node.divided:
+                for child in node.children():
+                    distance = child.boundary.distance_to_point(x, y)
+                    if distance <= max_distance:
+                        heapq.heappush(queue, (distance, next(order), child, None))
+
+        return found
+
+    def visit_circle(self, x, y, radius, callback):
+        # Callback form of query_circle, the same walk calls callback(point)
+        # for every point in the circle
+        for point in self.query_circle(x, y, radius):
+            callback(point)
+
+    def children(self):
+        return (self.northwest, self.northeast, self.southwest, self.southeast)
+
+    def find_all_pairs(self, max_distance):
+        # Walks the tree against itself: pairs inside each child, then pairs
+        # between sibling children, so every unordered pair shows up once
+        if not self.divided:
+            point_list = self.point_list
+            for i, point in enumerate(point_list):
+                for other in point_list[i + 1:]:
+                    yield point, other
+            return
+
+        children = self.children()
+        for i, child in enumerate(children):
+            yield from child.find_all_pairs(max_distance)
+            for sibling in children[i + 1:]:
+                yield from child.find_pairs_between(sibling, max_distance)
+
+    def find_pairs_between(self, other, max_distance):
+        # Nodes too far apart cannot hold a pair closer than max_distance
+        if self.boundary.distance_to(other.boundary) > max_distance:
+            return
+
+        if self.divided and (
+            not other.divided or self.boundary.width >= other.boundary.width
+        ):
+            for child in self.children():
+                yield from child.find_pairs_between(other, max_distance)
+        elif other.divided:
+            for child in other.children():
+                yield from self.find_pairs_between(child, max_distance)
+        else:
+            for point in self.point_list:
+                for neighbor in other.point_list:
+                    yield point, neighbor
 
-    def subdivide(self):
+    def create_children(self):
         x = self.boundary.x
         y = self.boundary.y
         width = self.boundary.width
         height = self.boundary.height
 
-        self.northwest = Quadtree(
+        # East and south children take the remainder so the four children
+        # tile the parent exactly and never reach outside of it
+        half_width = math.ceil(width / 2)
+        half_height = math.ceil(height / 2)
+
+        # Same class as the parent, which can be a profiled subclass
+        node_class = type(self)
+
+        self.northwest = node_class(
             self.window,
-            Rectangle(x, y, math.ceil(width / 2), math.ceil(height / 2)),
+            Rectangle(x, y, half_width, half_height),
             self.capacity,
+            self,
+            self.max_depth,
         )
-        self.northeast = Quadtree(
+        self.northeast = node_class(
             self.window,
-            Rectangle(
-                x + math.ceil(width / 2), y, math.ceil(width / 2), math.ceil(height / 2)
-            ),
+            Rectangle(x + half_width, y, width - half_width, half_height),
             self.capacity,
+            self,
+            self.max_depth,
         )
-        self.southwest = Quadtree(
+        self.southwest = node_class(
             self.window,
-            Rectangle(
-                x,
-                y + math.ceil(height / 2),
-                math.ceil(width / 2),
-                math.ceil(height / 2),
-            ),
+            Rectangle(x, y + half_height, half_width, height - half_height),
             self.capacity,
+            self,
+            self.max_depth,
         )
-        self.southeast = Quadtree(
+        self.southeast = node_class(
             self.window,
             Rectangle(
-                x + math.ceil(width / 2),
-                y + math.ceil(height / 2),
-                math.ceil(width / 2),
-                math.ceil(height / 2),
+                x + half_width,
+                y + half_height,
+                width - half_width,
+                height - half_height,
             ),
             self.capacity,
+            self,
+            self.max_depth,
         )
 
-        for point in self.point_list:
-            if self.northwest.boundary.contains(point):
-                self.northwest.insert(point)
-            if self.northeast.boundary.contains(point):
-                self.northeast.insert(point)
-            if self.southwest.boundary.contains(point):
-                self.southwest.insert(point)
-            if self.southeast.boundary.contains(point):
-                self.southeast.insert(point)
+        self.divided = True
 
+    def subdivide(self):
+        self.create_children()
+
+        point_list = self.point_list
         self.point_list = []
 
-        self.divided = True
+        # Each point goes to a single child so it is tracked by exactly one leaf
+        for point in point_list:
+            if self.boundary.contains(point):
+                self.insert_into_children(point)
+            else:
+                # The point moved away and was not updated yet
+                point.node = None
+                self.insert_from_ancestor(point)
 
     def create_random_points(self, amount):
         for i in range(amount):
@@ -248,30 +559,113 @@ class Quadtree:
             logging.debug(f"BOUNDARY: {self.boundary}")
             return False
 
-        if len(self.point_list) < self.capacity and not self.divided:
+        # Leaves that cannot split take any number of points, so points on
+        # the same spot (or too close to separate) stop the descent
+        if not self.divided and (
+            len(self.point_list) < self.capacity or not self.can_split()
+        ):
             self.point_list.append(point)
+            point.node = self
             return True
 
-        else:
-            if not self.divided:
-                self.subdivide()
-
-            if self.northwest.insert(point):
-                return True
-            elif self.northeast.insert(point):
-                return True
-            elif self.southwest.insert(point):
-                return True
-            elif self.southeast.insert(point):
-                return True
-            else:
-                logging.error(f"No quadrant found for point {point}")
-                return False
+        if not self.divided:
+            self.subdivide()
+
+        return self.insert_into_children(point)
+
+    def can_split(self):
+        # Not past the maximum depth, nor a single pixel node, whose halves
+        # would be rounded up to the same size again
+        return self.depth < self.max_depth and (
+            self.boundary.width > 1 or self.boundary.height > 1
+        )
+
+    def insert_into_children(self, point):
+        # Children are half-open: points on the middle lines belong to the
+        # east and south ones, so every point of the node has exactly one child
+        east = point.x >= self.northeast.boundary.x
+        south = point.y >= self.southwest.boundary.y
+
+        return self.children()[2 * south + east].insert(point)
+
+    def remove(self, point):
+        leaf = point.node
+        if leaf is None:
+            return False
+
+        leaf.point_list.remove(point)
+        point.node = None
+
+        leaf.merge_upwards()
+        return True
+
+    def update(self, point):
+        # Points that are not tracked yet (e.g. just spawned) are inserted
+        if point.node is None:
+            return self.insert(point)
+
+        # Nothing to do while the point stays inside its leaf
+        if point.node.boundary.contains(point):
+            return True
+
+        return self.relocate(point)
+
+    def relocate(self, point):
+        leaf = point.node
+        leaf.point_list.remove(point)
+        point.node = None
+
+        inserted = leaf.insert_from_ancestor(point)
+
+        # Merge the nodes the point left behind, if they emptied out
+        leaf.merge_upwards()
+
+        return inserted
+
+    def insert_from_ancestor(self, point):
+        # Climb to the closest ancestor that still contains the point and
+        # insert it from there instead of descending from the root
+        ancestor = self.parent
+        while ancestor is not None and not ancestor.boundary.contains(point):
+            ancestor = ancestor.parent
+
+        if ancestor is None:
+            logging.debug(f"POINT LEFT THE QUADTREE: {point}")
+            return False
+
+        return ancestor.insert(point)
+
+    def merge_upwards(self):
+        node = self.parent
+        while node is not None and node.merge():
+            node = node.parent
 
-        logging.error(f"No quadrant found for point {point}")
-        return False
+    def merge(self):
+        children = self.children()
+
+        if any(child.divided for child in children):
+            return False
+
+        if sum(len(child.point_list) for child in children) > self.capacity:
+            return False
+
+        for child in children:
+            for point in child.point_list:
+                point.node = self
+            self.point_list.extend(child.point_list)
+
+        del self.northwest
+        del self.northeast
+        del self.southwest
+        del self.southeast
+
+        self.divided = False
+        return True
 
     def clear(self):
+        for point in self.point_list:
+            point.node = None
+
         self.point_list = []
 
         if self.divided:
@@ -286,7 +680,124 @@ class Quadtree:
 
         self.divided = False
 
-    def draw(self):
+    def set_capacity(self, capacity):
+        # Rebuilds the tree with the new capacity on every node
+        points = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            points.extend(node.point_list)
+            if node.divided:
+                stack.extend(node.children())
+
+        self.capacity = capacity
+        self.bulk_load(points)
+
+    def update_all(self, point_list):
+        # Moving the points that left their leaf one by one costs more than
+        # building the whole tree again once enough of them did
+        moved = [
+            point
+            for point in point_list
+            if point.node is None or not point.node.boundary.contains(point)
+        ]
+
+        if len(moved) > len(point_list) * QUADTREE_REBUILD_FRACTION:
+            self.bulk_load(point_list)
+            return
+
+        for point in moved:
+            self.update(point)
+
+    def morton_levels(self):
+        # Every node is a single pixel after this many levels, if the tree did
+        # not stop at its maximum depth before. Codes hold 31 levels at most.
+        size = max(self.boundary.width, self.boundary.height)
+        levels = max(1, math.ceil(math.log2(max(size, 1))))
+        return min(31, self.max_depth - self.depth, levels)
+
+    def morton_codes(self, xs, ys, levels):
+        # Z-order code of the node each point falls in, levels deep: two bits
+        # per level, for the quadrant it takes at that level. The quadrants are
+        # found with the same rounded splits as create_children, so sorting by
+        # code lines the points up node by node.
+        count = len(xs)
+        node_x = np.full(count, float(self.boundary.x))
+        node_y = np.full(count, float(self.boundary.y))
+        width = np.full(count, float(self.boundary.width))
+        height = np.full(count, float(self.boundary.height))
+        codes = np.zeros(count, dtype=np.uint64)
+
+        for _ in range(levels):
+            half_width = np.ceil(width / 2)
+            half_height = np.ceil(height / 2)
+
+            # Points on a middle line go to the east or south child, like in
+            # insert_into_children
+            east = xs >= node_x + half_width
+            south = ys >= node_y + half_height
+
+            codes = (codes << np.uint64(2)) | (2 * south + east).astype(np.uint64)
+
+            node_x = np.where(east, node_x + half_width, node_x)
+            node_y = np.where(south, node_y + half_height, node_y)
+            width = np.where(east, width - half_width, half_width)
+            height = np.where(south, height - half_height, half_height)
+
+        return codes
+
+    def bulk_load(self, points):
+        # Builds the tree from scratch without inserting the points one by one.
+        # Sorted by Morton code, the points of every node are a contiguous run,
+        # so each node is split by finding where its children's runs start
+        # instead of descending from the root for every point.
+        self.clear()
+
+        boundary = self.boundary
+        xs = np.array([point.x for point in points], dtype=np.float64)
+        ys = np.array([point.y for point in points], dtype=np.float64)
+
+        inside = np.flatnonzero(
+            (xs >= boundary.x)
+            & (xs <= boundary.x + boundary.width)
+            & (ys >= boundary.y)
+            & (ys <= boundary.y + boundary.height)
+        )
+        if len(inside) < len(points):
+            logging.debug(f"{len(points) - len(inside)} POINTS OUTSIDE BOUNDARY: {boundary}")
+
+        levels = self.morton_levels()
+        codes = self.morton_codes(xs[inside], ys[inside], levels)
+        order = np.argsort(codes, kind="stable")
+
+        codes = codes[order].tolist()
+        sorted_points = [points[index] for index in inside[order].tolist()]
+
+        # Nodes still to build, with their run of points and their code prefix
+        stack = [(self, 0, len(sorted_points), 0, 0)]
+
+        while stack:
+            node, start, end, depth, prefix = stack.pop()
+
+            if end - start <= node.capacity or depth == levels or not node.can_split():
+                node.point_list = sorted_points[start:end]
+                for point in node.point_list:
+                    point.node = node
+                continue
+
+            node.create_children()
+
+            shift = 2 * (levels - depth - 1)
+            child_start = start
+            for quadrant, child in enumerate(node.children()):
+                child_prefix = prefix * 4 + quadrant
+                child_end = bisect.bisect_left(
+                    codes, (child_prefix + 1) << shift, child_start, end
+                )
+                stack.append((child, child_start, child_end, depth + 1, child_prefix))
+                child_start = child_end
+
+    def draw(self, draw_points=True):
         pygame.draw.rect(
             self.window,
             (0, 255, 0),
@@ -299,14 +810,29 @@ class Quadtree:
             1,
         )
 
-        for point in self.point_list:
-            point.draw(self.window)
+        # Points can be left to a renderer that draws them all at once
+        if draw_points:
+            for point in self.point_list:
+                point.draw(self.window)
 
         if self.divided:
-            self.northwest.draw()
-            self.northeast.draw()
-            self.southwest.draw()
-            self.southeast.draw()
+            self.northwest.draw(draw_points)
+            self.northeast.draw(draw_points)
+            self.southwest.draw(draw_points)
+            self.southeast.draw(draw_points)
+
+    def outline_rects(self):
+        # Rects drawn by draw, to find which parts of the overlay changed
+        boundary = self.boundary
+        rects = [(boundary.x, boundary.y, boundary.width, boundary.height)]
+
+        if self.divided:
+            rects.extend(self.northwest.outline_rects())
+            rects.extend(self.northeast.outline_rects())
+            rects.extend(self.southwest.outline_rects())
+            rects.extend(self.southeast.outline_rects())
+
+        return rects
 
     def print_quadtree(self):
         print(
@@ -0,0 +1,21 @@
+from src.config import GRID_CELL_SIZE, QUADTREE_CAPACITY, QUADTREE_MAX_DEPTH
+from src.game.quadtree import Quadtree
+from src.game.quadtree.grid import SpatialHashGrid
+from src.game.quadtree.sweep_and_prune import SweepAndPrune
+
+BROADPHASES = ("quadtree", "grid", "sweep")
+
+
+def create_broadphase(
+    name, window, boundary, capacity=QUADTREE_CAPACITY, max_depth=QUADTREE_MAX_DEPTH
+):
+    if name == "grid":
+        return SpatialHashGrid(window, boundary, GRID_CELL_SIZE)
+
+    if name == "sweep":
+        return SweepAndPrune(window, boundary)
+
+    if name == "quadtree":
+        return Quadtree(window, boundary, capacity, max_depth=max_depth)
+
+    raise ValueError(f"Unknown broad phase: {name}")
@@ -0,0 +1,147 @@
+import math
+
+from src.config import POINT_RADIUS, QUADTREE_CAPACITY
+from src.game.quadtree import MAX_SPEED, Quadtree, Rectangle
+
+
+def time_of_impact(x, y, dx, dy, other_x, other_y, other_dx, other_dy, radius_sum):
+    # Two circles moving in a straight line during a step, from (x, y) by
+    # (dx, dy). Returns the fraction of the step at which they first touch,
+    # or None if they stay apart for the whole step.
+    gap_x = other_x - x
+    gap_y = other_y - y
+    motion_x = other_dx - dx
+    motion_y = other_dy - dy
+
+    # |gap + motion * t| = radius_sum, solved for t
+    a = motion_x * motion_x + motion_y * motion_y
+    b = 2 * (gap_x * motion_x + gap_y * motion_y)
+    c = gap_x * gap_x + gap_y * gap_y - radius_sum * radius_sum
+
+    # Already overlapping when the step started
+    if c < 0:
+        return 0.0
+
+    # Not moving relative to each other, or moving apart
+    if a == 0 or b >= 0:
+        return None
+
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0:
+        return None
+
+    t = (-b - math.sqrt(discriminant)) / (2 * a)
+    if t > 1:
+        return None
+
+    return t
+
+
+class SweptBounds:
+    # Box covering a point over the whole last step, from its previous
+    # position to its current one. It is stored in the quadtree by its center.
+    __slots__ = (
+        "point",
+        "node",
+        "start_x",
+        "start_y",
+        "dx",
+        "dy",
+        "radius",
+        "half_width",
+        "half_height",
+        "x",
+        "y",
+    )
+
+    def __init__(self, point):
+        self.point = point
+        self.node = None
+        self.refresh()
+
+    def refresh(self):
+        point = self.point
+        buffer = point.buffer
+        index = point.index
+
+        self.start_x = float(buffer.previous_x[index])
+        self.start_y = float(buffer.previous_y[index])
+        self.dx = point.x - self.start_x
+        self.dy = point.y - self.start_y
+        self.radius = float(buffer.radius[index])
+
+        self.half_width = abs(self.dx) / 2 + self.radius
+        self.half_height = abs(self.dy) / 2 + self.radius
+        self.x = self.start_x + self.dx / 2
+        self.y = self.start_y + self.dy / 2
+
+    def overlaps(self, other):
+        return (
+            abs(self.x - other.x) <= self.half_width + other.half_width
+            and abs(self.y - other.y) <= self.half_height + other.half_height
+        )
+
+    def __str__(self):
+        return f"SweptBounds({self.point})"
+
+
+class ContinuousCollisionDetector:
+    def __init__(self, boundary, step_size, capacity=QUADTREE_CAPACITY):
+        # Points may overshoot the canvas by up to a step before bouncing
+        # back, which is far at low tick rates, so the tree of swept bounds
+        # reaches past it by as much as a point can move in a step
+        margin = 2 * POINT_RADIUS + MAX_SPEED * step_size
+        self.quadtree = Quadtree(
+            None,
+            Rectangle(
+                boundary.x - margin,
+                boundary.y - margin,
+                boundary.width + 2 * margin,
+                boundary.height + 2 * margin,
+            ),
+            capacity,
+        )
+        self.bounds = {}
+
+    def update(self, point_list):
+        # Sweeps every point over the last step and moves its box in the tree
+        bounds_list = []
+        for point in point_list:
+            bounds = self.bounds.get(point)
+            if bounds is None:
+                bounds = self.bounds[point] = SweptBounds(point)
+            else:
+                bounds.refresh()
+
+            bounds_list.append(bounds)
+
+        self.quadtree.update_all(bounds_list)
+
+    def find_impacts(self):
+        # Yields (point, other, time) for every pair of swept boxes that
+        # overlap; time is the fraction of the step at which the two circles
+        # touch, or None if they just pass by each other
+        if not self.bounds:
+            return
+
+        half_width = max(bounds.half_width for bounds in self.bounds.values())
+        half_height = max(bounds.half_height for bounds in self.bounds.values())
+        max_distance = 2 * math.hypot(half_width, half_height)
+
+        for bounds, other in self.quadtree.find_all_pairs(max_distance):
+            if not bounds.overlaps(other):
+                continue
+
+            impact_time = time_of_impact(
+                bounds.start_x,
+                bounds.start_y,
+                bounds.dx,
+                bounds.dy,
+                other.start_x,
+                other.start_y,
+                other.dx,
+                other.dy,
+                bounds.radius + other.radius,
+            )
+
+            yield bounds.point, other.point, impact_time
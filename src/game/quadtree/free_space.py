@@ -0,0 +1,72 @@
+import math
+
+from src.game.quadtree import Rectangle
+
+
+def is_free(broadphase, area, clearance, obstacles=()):
+    # True if every point of the broad phase, and every obstacle, is farther
+    # than clearance from the whole area, so anywhere inside it is a valid spot
+    for point in obstacles:
+        if area.distance_to_point(point.x, point.y) <= clearance:
+            return False
+
+    reach = Rectangle(
+        area.x - clearance,
+        area.y - clearance,
+        area.width + 2 * clearance,
+        area.height + 2 * clearance,
+    )
+
+    for point in broadphase.iter_range(reach):
+        if area.distance_to_point(point.x, point.y) <= clearance:
+            return False
+
+    return True
+
+
+def free_regions(broadphase, area, clearance, min_size, obstacles=()):
+    # Splits the area in quadrants like the quadtree does, keeping the ones
+    # no point comes closer than clearance to and splitting the others again
+    # until they are smaller than min_size. The number of quadrants checked is
+    # bounded by the area and min_size, however the points are spread.
+    # Obstacles are points not in the broad phase that still take room, like
+    # the ones playing the spawn animation.
+    regions = []
+    stack = [area]
+
+    while stack:
+        region = stack.pop()
+
+        if is_free(broadphase, region, clearance, obstacles):
+            regions.append(region)
+            continue
+
+        if region.width < 2 * min_size or region.height < 2 * min_size:
+            continue
+
+        half_width = math.ceil(region.width / 2)
+        half_height = math.ceil(region.height / 2)
+        rest_width = region.width - half_width
+        rest_height = region.height - half_height
+
+        stack.append(Rectangle(region.x, region.y, half_width, half_height))
+        stack.append(Rectangle(region.x + half_width, region.y, rest_width, half_height))
+        stack.append(Rectangle(region.x, region.y + half_height, half_width, rest_height))
+        stack.append(
+            Rectangle(region.x + half_width, region.y + half_height, rest_width, rest_height)
+        )
+
+    return regions
+
+
+def sample_free_position(regions, rng):
+    # Uniform over the free space: a region picked by its area, then a spot in it
+    if not regions:
+        return None
+
+    region = rng.choices(regions, weights=[region.width * region.height for region in regions])[0]
+
+    return (
+        rng.uniform(region.x, region.x + region.width),
+        rng.uniform(region.y, region.y + region.height),
+    )
@@ -0,0 +1,203 @@
+import logging
+import math
+
+import pygame
+
+
+class SpatialHashGrid:
+    def __init__(self, window, boundary, cell_size):
+        self.window = window
+        self.boundary = boundary
+        self.cell_size = cell_size
+
+        # Points by cell, and the cell each point is currently stored in
+        self.cells = {}
+        self.point_cells = {}
+
+    def cell_of(self, x, y):
+        return (
+            int((x - self.boundary.x) // self.cell_size),
+            int((y - self.boundary.y) // self.cell_size),
+        )
+
+    def query_range(self, area):
+        return list(self.iter_range(area))
+
+    def iter_range(self, area):
+        first_column, first_row = self.cell_of(area.x, area.y)
+        last_column, last_row = self.cell_of(area.x + area.width, area.y + area.height)
+
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                for point in self.cells.get((column, row), ()):
+                    if area.contains(point):
+                        yield point
+
+    def query_circle(self, x, y, radius):
+        first_column, first_row = self.cell_of(x - radius, y - radius)
+        last_column, last_row = self.cell_of(x + radius, y + radius)
+
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                for point in self.cells.get((column, row), ()):
+                    if math.hypot(point.x - x, point.y - y) <= radius:
+                        yield point
+
+    def nearest(self, x, y, k=1, max_distance=math.inf, exclude=None):
+        # Cells are searched in growing rings around the cell of (x, y): the
+        # points of ring r are at least (r - 1) cells away, so the search
+        # stops once the k-th closest point found is nearer than the next ring.
+        column, row = self.cell_of(x, y)
+        columns = math.ceil(self.boundary.width / self.cell_size)
+        rows = math.ceil(self.boundary.height / self.cell_size)
+        last_ring = max(abs(column), abs(columns - column), abs(row), abs(rows - row)) + 1
+
+        found = []
+        for ring in range(last_ring + 1):
+            if (ring - 1) * self.cell_size > max_distance:
+                break
+
+            for cell in self.ring_cells(column, row, ring):
+                for point in self.cells.get(cell, ()):
+                    if point is not exclude:
+                        distance = math.hypot(point.x - x, point.y - y)
+                        if distance <= max_distance:
+                            found.append((distance, point.index, point))
+
+            found.sort(key=lambda item: item[:2])
+            del found[k:]
+            if len(found) == k and found[-1][0] <= ring * self.cell_size:
+                break
+
+        return [point for _, _, point in found]
+
+    @staticmethod
+    def ring_cells(column, row, ring):
+        # Cells on the border of the square ring cells away from (column, row)
+        if ring == 0:
+            yield column, row
+            return
+
+        for offset in range(-ring, ring + 1):
+            yield column + offset, row - ring
+            yield column + offset, row + ring
+        for offset in range(-ring + 1, ring):
+            yield column - ring, row + offset
+            yield column + ring, row + offset
+
+    def find_all_pairs(self, max_distance):
+        reach = math.ceil(max_distance / self.cell_size)
+
+        # Only the neighbors "after" each cell are visited, so a pair of
+        # cells, and every pair of points in them, is considered once
+        offsets = [
+            (column, row)
+            for column in range(0, reach + 1)
+            for row in range(-reach, reach + 1)
+            if column > 0 or row > 0
+        ]
+
+        cells = self.cells
+        for (column, row), cell in cells.items():
+            for i, point in enumerate(cell):
+                for other in cell[i + 1:]:
+                    yield point, other
+
+            for column_offset, row_offset in offsets:
+                neighbor = cells.get((column + column_offset, row + row_offset))
+                if neighbor:
+                    for point in cell:
+                        for other in neighbor:
+                            yield point, other
+
+    def insert(self, point):
+        if not self.boundary.contains(point):
+            logging.debug(f"POINT OUTSIDE BOUNDARY: {point}")
+            logging.debug(f"BOUNDARY: {self.boundary}")
+            return False
+
+        key = self.cell_of(point.x, point.y)
+        self.cells.setdefault(key, []).append(point)
+        self.point_cells[point] = key
+
+        return True
+
+    def remove(self, point):
+        key = self.point_cells.pop(point, None)
+        if key is None:
+            return False
+
+        cell = self.cells[key]
+        cell.remove(point)
+        if not cell:
+            del self.cells[key]
+
+        return True
+
+    def update(self, point):
+        key = self.point_cells.get(point)
+        if key is None:
+            return self.insert(point)
+
+        # Nothing to do while the point stays inside its cell
+        if key == self.cell_of(point.x, point.y):
+            return True
+
+        self.remove(point)
+        return self.insert(point)
+
+    def update_all(self, point_list):
+        for point in point_list:
+            self.update(point)
+
+    def clear(self):
+        self.cells = {}
+        self.point_cells = {}
+
+    def outline_rects(self):
+        # The boundary and every occupied cell, as draw outlines them
+        boundary = self.boundary
+        rects = [(boundary.x, boundary.y, boundary.width, boundary.height)]
+
+        for column, row in self.cells:
+            rects.append(
+                (
+                    boundary.x + column * self.cell_size,
+                    boundary.y + row * self.cell_size,
+                    self.cell_size,
+                    self.cell_size,
+                )
+            )
+
+        return rects
+
+    def draw(self, draw_points=True):
+        pygame.draw.rect(
+            self.window,
+            (0, 255, 0),
+            (
+                self.boundary.x,
+                self.boundary.y,
+                self.boundary.width,
+                self.boundary.height,
+            ),
+            1,
+        )
+
+        # Only occupied cells are drawn
+        for (column, row), cell in self.cells.items():
+            pygame.draw.rect(
+                self.window,
+                (0, 255, 0),
+                (
+                    self.boundary.x + column * self.cell_size,
+                    self.boundary.y + row * self.cell_size,
+                    self.cell_size,
+                    self.cell_size,
+                ),
+                1,
+            )
+
+            if draw_points:
+                for point in cell:
+                    point.draw(self.window)
@@ -0,0 +1,248 @@
+import heapq
+import itertools
+import math
+
+from src.config import (
+    CANVAS_HEIGHT,
+    CANVAS_WIDTH,
+    CANVAS_X_POSITION,
+    CANVAS_Y_POSITION,
+)
+from src.game.quadtree import MAX_SPEED, Point
+
+
+class KineticEvent:
+    BOUNCE = 1
+    REFRESH = 2
+
+
+class KineticScheduler:
+    # Velocities only change on wall bounces and clicks, so when two nearby
+    # points will collide is known ahead. Predicted collisions wait in a
+    # priority queue by step, and only the ones due are checked instead of
+    # every nearby pair every step. A point's predictions are dropped only
+    # when its velocity changes: bounces are predicted too and come out of
+    # their own queue, clicks have to be reported with velocity_changed.
+    #
+    # Each point looks again for the points it could meet in two horizons
+    # every horizon, so any collision within a horizon is always known. That
+    # only adds predictions, the ones already queued stay valid.
+    def __init__(self, broadphase, step_size, horizon):
+        self.broadphase = broadphase
+        self.step_size = step_size
+        self.horizon = max(1, horizon)
+        self.reach = 2 * Point.collision_radius + 2 * MAX_SPEED * step_size * 2 * self.horizon
+
+        # Steps simulated so far
+        self.step = 0
+        # Predictions made for a point before its velocity last changed are stale
+        self.versions = {}
+        # (step, order, point, other, point version, other version)
+        self.collisions = []
+        # Predictions in the queue, so a refresh does not queue one twice
+        self.predicted = set()
+        # (step, order, kind, point, version, velocity)
+        self.point_events = []
+        self.order = itertools.count()
+
+        # Pairs checked since last asked, for the HUD
+        self.checks = 0
+
+    def add(self, point):
+        # A point that joins between steps. It may not be in the broad phase
+        # yet, and the others have to find it when their velocity changes.
+        self.broadphase.update(point)
+        self.reschedule(point, 1)
+
+    def add_all(self, point_list):
+        for point in point_list:
+            self.versions[point] = 0
+        for point in point_list:
+            self.reschedule(point, 1)
+
+    def velocity_changed(self, point):
+        # Between steps, the collisions of the current one were checked already
+        self.reschedule(point, 1)
+
+    def reschedule(self, point, first):
+        # Predictions for point from its current position and velocity,
+        # first is the earliest step from now a collision is looked for.
+        # The ones made before are stale from now on.
+        version = self.versions.get(point, 0) + 1
+        self.versions[point] = version
+
+        velocity = point.velocity
+        bounce = self.steps_to_bounce(point, velocity)
+        if bounce is not None:
+            heapq.heappush(
+                self.point_events,
+                (self.step + bounce, next(self.order), KineticEvent.BOUNCE, point, version, velocity),
+            )
+        self.refresh(point, first)
+
+    def refresh(self, point, first):
+        # Pairs within reach now, with the point's velocity unchanged
+        heapq.heappush(
+            self.point_events,
+            (
+                self.step + self.horizon,
+                next(self.order),
+                KineticEvent.REFRESH,
+                point,
+                self.versions[point],
+                point.velocity,
+            ),
+        )
+
+        for other in self.broadphase.query_circle(point.x, point.y, self.reach):
+            if other is not point and other in self.versions:
+                self.schedule_pair(point, other, first)
+
+    def steps_to_bounce(self, point, velocity):
+        # Steps until the point is past a wall, the step it turns around on
+        radius = point.collision_radius
+        steps = [
+            self.axis_steps(
+                point.x, velocity[0], CANVAS_X_POSITION + radius, CANVAS_X_POSITION + CANVAS_WIDTH - radius
+            ),
+            self.axis_steps(
+                point.y, velocity[1], CANVAS_Y_POSITION + radius, CANVAS_Y_POSITION + CANVAS_HEIGHT - radius
+            ),
+        ]
+        steps = [step for step in steps if step is not None]
+        return min(steps, default=None)
+
+    def axis_steps(self, position, velocity, low, high):
+        speed = velocity * self.step_size
+
+        # A click can turn a point back into the wall it just bounced on. It
+        # is still past the wall after the next step and turns around again,
+        # whichever way it moves.
+        if position + speed < low or position + speed > high:
+            return 1
+
+        if speed > 0:
+            return max(1, math.floor((high - position) / speed) + 1)
+        if speed < 0:
+            return max(1, math.floor((low - position) / speed) + 1)
+        return None
+
+    def schedule_pair(self, point, other, first):
+        # Squared distance after u steps is a u² + 2 b u + c, the points
+        # overlap between both roots. The first whole step in there is when
+        # the collision check of a step would find them.
+        velocity = point.velocity
+        other_velocity = other.velocity
+
+        dx = other.x - point.x
+        dy = other.y - point.y
+        vx = (other_velocity[0] - velocity[0]) * self.step_size
+        vy = (other_velocity[1] - velocity[1]) * self.step_size
+        radius = point.collision_radius + other.collision_radius
+
+        a = vx * vx + vy * vy
+        b = dx * vx + dy * vy
+        c = dx * dx + dy * dy - radius * radius
+
+        if a == 0:
+            if c >= 0:
+                return
+            start, end = -math.inf, math.inf
+        else:
+            discriminant = b * b - a * c
+            if discriminant <= 0:
+                return
+            root = math.sqrt(discriminant)
+            start = (-b - root) / a
+            end = (-b + root) / a
+
+        steps = max(first, math.floor(start) + 1) if start > -math.inf else first
+        if steps >= end:
+            return
+
+        event = (
+            self.step + steps,
+            next(self.order),
+            point,
+            other,
+            self.versions[point],
+            self.versions[other],
+        )
+        key = self.prediction_key(event)
+        if key in self.predicted:
+            return
+
+        self.predicted.add(key)
+        heapq.heappush(self.collisions, event)
+
+    def prediction_key(self, event):
+        # The same prediction whichever point of the pair made it
+        step, _, point, other, version, other_version = event
+        if id(other) < id(point):
+            return step, other, other_version, point, version
+        return step, point, version, other, other_version
+
+    def pop_collision(self):
+        event = heapq.heappop(self.collisions)
+        self.predicted.discard(self.prediction_key(event))
+        return event
+
+    def stale(self, event):
+        _, _, point, other, version, other_version = event
+        return self.versions[point] != version or self.versions[other] != other_version
+
+    def advance(self):
+        # Called once the points moved a step and the broad phase is up to
+        # date. Returns the first colliding pair due, None if there is none.
+        self.step += 1
+        step = self.step
+
+        # Bounces and refreshes first, their new predictions can be due now
+        while self.point_events and self.point_events[0][0] <= step:
+            _, _, kind, point, version, velocity = heapq.heappop(self.point_events)
+            if self.versions[point] != version:
+                continue
+
+            if kind == KineticEvent.BOUNCE and point.velocity == velocity:
+                # Positions add up step by step and can be a rounding error
+                # away from the prediction, the bounce comes on the next step
+                heapq.heappush(
+                    self.point_events,
+                    (step + 1, next(self.order), kind, point, version, velocity),
+                )
+                continue
+
+            if kind == KineticEvent.BOUNCE:
+                self.reschedule(point, 0)
+            else:
+                self.refresh(point, 0)
+
+        while self.collisions and self.collisions[0][0] <= step:
+            event = self.pop_collision()
+            if self.stale(event):
+                continue
+
+            _, _, point, other, _, _ = event
+            self.checks += 1
+            if (
+                math.hypot(point.x - other.x, point.y - other.y)
+                < point.collision_radius + other.collision_radius
+            ):
+                return point, other
+
+            # Not overlapping yet by a rounding error, looked at again
+            self.schedule_pair(point, other, 1)
+
+        return None
+
+    def steps_to_collision(self):
+        # Steps until the next predicted collision, None when there is none
+        # within the horizon (later ones may not be known yet)
+        collisions = self.collisions
+        while collisions and self.stale(collisions[0]):
+            self.pop_collision()
+
+        if not collisions or collisions[0][0] - self.step > self.horizon:
+            return None
+
+        return collisions[0][0] - self.step
@@ -0,0 +1,186 @@
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.config import POINT_RADIUS
+
+# Shared memory blocks already attached in this worker process, by name
+attached_blocks = {}
+
+
+def attach(name):
+    block = attached_blocks.get(name)
+    if block is None:
+        # Drop blocks of previous frames that were replaced by a larger one
+        for old in attached_blocks.values():
+            old.close()
+        attached_blocks.clear()
+
+        block = shared_memory.SharedMemory(name=name)
+        attached_blocks[name] = block
+
+    return block
+
+
+def coordinates_view(block, capacity, size):
+    arrays = np.ndarray((3, capacity), dtype=np.float64, buffer=block.buf)
+    return arrays[0, :size], arrays[1, :size], arrays[2, :size]
+
+
+def find_collisions_in_region(x, y, radius, core_start, core_end, margin):
+    # Points of the strip plus a ghost margin on both sides, so pairs that
+    # cross the strip border are seen whole
+    indices = np.nonzero((x >= core_start - margin) & (x < core_end + margin))[0]
+    if len(indices) < 2:
+        return np.empty((0, 2), dtype=np.int64), 0
+
+    # Uniform grid with cells of the margin size, points sorted by cell. Rows
+    # are shifted by one so the rows above and below never wrap around.
+    px = x[indices]
+    py = y[indices]
+    column = np.floor((px - px.min()) / margin).astype(np.int64)
+    row = np.floor((py - py.min()) / margin).astype(np.int64) + 1
+    rows = int(row.max()) + 2
+    keys = column * rows + row
+
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    indices = indices[order]
+    position = np.arange(len(keys))
+
+    cell_keys, cell_start, cell_count = np.unique(keys, return_index=True, return_counts=True)
+    cell_of_point = np.repeat(np.arange(len(cell_keys)), cell_count)
+
+    first_list = []
+    second_list = []
+
+    # Same cell, the cell below and the three cells of the next column, so
+    # every pair of neighbor cells is visited once
+    for offset in (0, 1, rows - 1, rows, rows + 1):
+        if offset == 0:
+            # Only the points after this one in its own cell
+            start = position + 1
+            count = cell_start[cell_of_point] + cell_count[cell_of_point] - start
+        else:
+            target = cell_keys + offset
+            found_at = np.minimum(np.searchsorted(cell_keys, target), len(cell_keys) - 1)
+            found = cell_keys[found_at] == target
+
+            start = np.where(found, cell_start[found_at], 0)[cell_of_point]
+            count = np.where(found, cell_count[found_at], 0)[cell_of_point]
+
+        total = int(count.sum())
+        if total == 0:
+            continue
+
+        # One row per point of the neighbor cell, for every point
+        run_offsets = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+        first_list.append(np.repeat(position, count))
+        second_list.append(np.repeat(start, count) + run_offsets)
+
+    if not first_list:
+        return np.empty((0, 2), dtype=np.int64), 0
+
+    first = indices[np.concatenate(first_list)]
+    second = indices[np.concatenate(second_list)]
+
+    # A pair belongs to the strip that holds its leftmost point, so each
+    # pair is reported by a single strip
+    left_x = np.minimum(x[first], x[second])
+    owned = (left_x >= core_start) & (left_x < core_end)
+    first = first[owned]
+    second = second[owned]
+    checks = len(first)
+
+    distance = np.hypot(x[second] - x[first], y[second] - y[first])
+    hit = distance < radius[first] + radius[second]
+    first = first[hit]
+    second = second[hit]
+
+    pairs = np.column_stack((np.minimum(first, second), np.maximum(first, second)))
+    return pairs, checks
+
+
+def merge_pairs(pair_arrays, size):
+    # Joins the pairs of every strip, dropping duplicates and sorting them
+    pairs = np.concatenate(pair_arrays)
+    keys = np.unique(pairs[:, 0] * size + pairs[:, 1])
+    return np.column_stack((keys // size, keys % size))
+
+
+def find_collisions_task(task):
+    name, capacity, size, core_start, core_end, margin = task
+    x, y, radius = coordinates_view(attach(name), capacity, size)
+    return find_collisions_in_region(x, y, radius, core_start, core_end, margin)
+
+
+class ParallelCollisionEngine:
+    def __init__(self, boundary, workers, margin=2 * POINT_RADIUS):
+        self.boundary = boundary
+        self.workers = workers
+        self.margin = margin
+
+        self.block = None
+        self.capacity = 0
+
+        # Only built for more than one worker, a single one goes through the
+        # broad phase in the scene instead
+        self.pool = multiprocessing.get_context("spawn").Pool(workers)
+
+    def strips(self):
+        # Vertical strips of the canvas, the outer ones open to the sides so
+        # points slightly outside the canvas are still covered
+        width = self.boundary.width / self.workers
+
+        for i in range(self.workers):
+            start = self.boundary.x + i * width if i > 0 else -math.inf
+            end = self.boundary.x + (i + 1) * width if i < self.workers - 1 else math.inf
+            yield start, end
+
+    def share(self, buffer):
+        # Copies the coordinates into shared memory, growing the block if needed
+        if buffer.size > self.capacity:
+            self.release()
+            self.capacity = max(64, 2 * buffer.size)
+            self.block = shared_memory.SharedMemory(
+                create=True, size=3 * self.capacity * np.dtype(np.float64).itemsize
+            )
+
+        x, y, radius = coordinates_view(self.block, self.capacity, buffer.size)
+        x[:] = buffer.x[: buffer.size]
+        y[:] = buffer.y[: buffer.size]
+        radius[:] = buffer.radius[: buffer.size]
+
+    def find_collisions(self, buffer):
+        # Returns the colliding buffer indices as an (n, 2) array of sorted
+        # (i, j) rows with i < j, and the number of pairs that were checked
+        self.share(buffer)
+
+        tasks = [
+            (self.block.name, self.capacity, buffer.size, start, end, self.margin)
+            for start, end in self.strips()
+        ]
+
+        results = self.pool.map(find_collisions_task, tasks)
+
+        pairs = merge_pairs([strip_pairs for strip_pairs, _ in results], max(buffer.size, 1))
+        checks = sum(strip_checks for _, strip_checks in results)
+
+        return pairs, checks
+
+    def release(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+            self.capacity = 0
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+        self.release()
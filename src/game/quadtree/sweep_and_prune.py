@@ -0,0 +1,193 @@
+import bisect
+import heapq
+import itertools
+import logging
+import math
+import operator
+
+import pygame
+
+
+class SweepAndPrune:
+    def __init__(self, window, boundary):
+        self.window = window
+        self.boundary = boundary
+
+        # Points sorted along the x axis and their x at the last sort. All
+        # points share the same radius, so sorting the centers keeps the
+        # interval endpoints in the same order.
+        self.point_list = []
+        self.x_list = []
+        self.members = set()
+        # Whether x_list still matches the points, queries sort again if not
+        self.sorted = True
+
+    def sort(self):
+        # Points barely move between frames, so the list is almost sorted
+        # already and Timsort, which finds the sorted runs, is close to linear
+        self.point_list.sort(key=operator.attrgetter("x"))
+        self.x_list = [point.x for point in self.point_list]
+        self.sorted = True
+
+    def ensure_sorted(self):
+        if not self.sorted:
+            self.sort()
+
+    def find_all_pairs(self, max_distance):
+        self.ensure_sorted()
+
+        point_list = self.point_list
+        x_list = self.x_list
+        y_list = [point.y for point in point_list]
+        size = len(point_list)
+
+        for i in range(size):
+            x_limit = x_list[i] + max_distance
+            y = y_list[i]
+
+            j = i + 1
+            while j < size and x_list[j] <= x_limit:
+                if abs(y_list[j] - y) <= max_distance:
+                    yield point_list[i], point_list[j]
+                j += 1
+
+    def query_range(self, area):
+        return list(self.iter_range(area))
+
+    def iter_range(self, area):
+        self.ensure_sorted()
+
+        start = bisect.bisect_left(self.x_list, area.x)
+        end = bisect.bisect_right(self.x_list, area.x + area.width)
+
+        for index in range(start, end):
+            point = self.point_list[index]
+            if area.contains(point):
+                yield point
+
+    def query_circle(self, x, y, radius):
+        self.ensure_sorted()
+
+        start = bisect.bisect_left(self.x_list, x - radius)
+        end = bisect.bisect_right(self.x_list, x + radius)
+
+        for index in range(start, end):
+            point = self.point_list[index]
+            if math.hypot(point.x - x, point.y - y) <= radius:
+                yield point
+
+    def nearest(self, x, y, k=1, max_distance=math.inf, exclude=None):
+        # Walks out from x along the sorted list, always to the side closer
+        # in x, and stops once that is farther than the k-th closest point.
+        self.ensure_sorted()
+
+        point_list = self.point_list
+        x_list = self.x_list
+        right = bisect.bisect_left(x_list, x)
+        left = right - 1
+
+        # Max-heap of the closest points so far, the farthest on top
+        best = []
+        order = itertools.count()
+        limit = max_distance
+
+        while left >= 0 or right < len(x_list):
+            left_gap = x - x_list[left] if left >= 0 else math.inf
+            right_gap = x_list[right] - x if right < len(x_list) else math.inf
+            if min(left_gap, right_gap) > limit:
+                break
+
+            if left_gap <= right_gap:
+                index = left
+                left -= 1
+            else:
+                index = right
+                right += 1
+
+            point = point_list[index]
+            if point is exclude:
+                continue
+
+            distance = math.hypot(point.x - x, point.y - y)
+            if distance <= limit:
+                heapq.heappush(best, (-distance, -point.index, -next(order), point))
+                if len(best) > k:
+                    heapq.heappop(best)
+                if len(best) == k:
+                    limit = -best[0][0]
+
+        best.sort(reverse=True)
+        return [point for _, _, _, point in best]
+
+    def insert(self, point):
+        if not self.boundary.contains(point):
+            logging.debug(f"POINT OUTSIDE BOUNDARY: {point}")
+            logging.debug(f"BOUNDARY: {self.boundary}")
+            return False
+
+        # New points go to the end and are sorted in by the next query
+        self.point_list.append(point)
+        self.x_list.append(point.x)
+        self.members.add(point)
+        self.sorted = False
+
+        return True
+
+    def remove(self, point):
+        if point not in self.members:
+            return False
+
+        index = self.point_list.index(point)
+        del self.point_list[index]
+        del self.x_list[index]
+        self.members.remove(point)
+
+        return True
+
+    def update(self, point):
+        if point not in self.members:
+            return self.insert(point)
+
+        # Points that left are dropped, like the quadtree and the grid do
+        if not self.boundary.contains(point):
+            logging.debug(f"POINT LEFT THE BOUNDARY: {point}")
+            self.remove(point)
+            return False
+
+        self.sorted = False
+        return True
+
+    def update_all(self, point_list):
+        for point in point_list:
+            self.update(point)
+
+        # Sorted once per step, the queries until the next one reuse it
+        self.sort()
+
+    def clear(self):
+        self.point_list = []
+        self.x_list = []
+        self.members = set()
+        self.sorted = True
+
+    def outline_rects(self):
+        # Only the boundary is drawn
+        boundary = self.boundary
+        return [(boundary.x, boundary.y, boundary.width, boundary.height)]
+
+    def draw(self, draw_points=True):
+        pygame.draw.rect(
+            self.window,
+            (0, 255, 0),
+            (
+                self.boundary.x,
+                self.boundary.y,
+                self.boundary.width,
+                self.boundary.height,
+            ),
+            1,
+        )
+
+        if draw_points:
+            for point in self.point_list:
+                point.draw(self.window)
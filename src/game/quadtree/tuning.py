@@ -0,0 +1,64 @@
+import logging
+import statistics
+
+from src.config import QUADTREE_TUNING_CAPACITIES, QUADTREE_TUNING_STEPS
+
+# Capacity option that has the scenes tune the capacity while running
+AUTO_CAPACITY = "auto"
+
+
+class CapacityTuner:
+    # Picks the quadtree capacity from what the simulation steps actually
+    # cost while running: each capacity is timed for a few steps, the
+    # neighbors of the cheapest one are tried in turn, and the tree settles
+    # on the best. Costs are per point and measured again once the number of
+    # points changed enough, so the choice follows a game as it grows.
+    def __init__(
+        self,
+        quadtree,
+        capacities=QUADTREE_TUNING_CAPACITIES,
+        steps=QUADTREE_TUNING_STEPS,
+    ):
+        self.quadtree = quadtree
+        self.capacities = sorted(set(capacities) | {quadtree.capacity})
+        self.steps = steps
+
+        # Median cost per point of a step, by capacity
+        self.costs = {}
+        self.samples = []
+        self.measured_points = None
+
+    def record(self, elapsed, number_of_points):
+        # elapsed is the time a step spent updating the tree and finding pairs
+        self.samples.append(elapsed / max(1, number_of_points))
+        if len(self.samples) < self.steps:
+            return
+
+        capacity = self.quadtree.capacity
+        cost = statistics.median(self.samples)
+        self.samples = []
+
+        # Costs measured for another number of points do not compare anymore
+        if self.measured_points is None or not (
+            2 / 3 <= number_of_points / self.measured_points <= 3 / 2
+        ):
+            self.costs = {}
+            self.measured_points = number_of_points
+
+        self.costs[capacity] = cost
+
+        best = min(self.costs, key=self.costs.get)
+        index = self.capacities.index(best)
+        for neighbor in self.capacities[max(0, index - 1) : index + 2]:
+            if neighbor not in self.costs:
+                self.set_capacity(neighbor)
+                return
+
+        if best != capacity:
+            logging.info(f"Quadtree capacity tuned to {best} for {number_of_points} points")
+            self.set_capacity(best)
+
+    def set_capacity(self, capacity):
+        # The steps timed so far were for the old capacity
+        self.samples = []
+        self.quadtree.set_capacity(capacity)
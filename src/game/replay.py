@@ -0,0 +1,111 @@
+import struct
+
+# A game log is a header, the initial points, then the input of the game as
+# events tagged with the tick before which they happened
+MAGIC = b"QTRP"
+VERSION = 3
+
+# Magic, version, flags, tick rate, seed, length of the difficulty name
+HEADER = struct.Struct("<4sBBHQB")
+POINT_COUNT = struct.Struct("<I")
+# x, y, vx, vy
+POINT = struct.Struct("<4d")
+# Tick, kind
+EVENT = struct.Struct("<IB")
+# Mouse position of a click
+CLICK = struct.Struct("<2H")
+
+FLAG_CCD = 1
+
+
+class ReplayEvent:
+    # Also where a spawning point moved to, if its spot was taken meanwhile
+    SPAWN = 1
+    CLICK = 2
+    END = 3
+
+
+def point_state(point):
+    return (point.x, point.y) + point.velocity
+
+
+class ReplayRecorder:
+    # Writes a game as it is played: what it started with, every point that
+    # spawned and every click, so it can be played again exactly
+    def __init__(self, path, difficulty, seed, tick_rate, ccd, point_list):
+        self.file = open(path, "wb")
+
+        name = difficulty.encode()
+        self.file.write(
+            HEADER.pack(MAGIC, VERSION, FLAG_CCD if ccd else 0, tick_rate, seed, len(name))
+        )
+        self.file.write(name)
+
+        self.file.write(POINT_COUNT.pack(len(point_list)))
+        for point in point_list:
+            self.file.write(POINT.pack(*point_state(point)))
+
+    def spawn(self, tick, point):
+        self.file.write(EVENT.pack(tick, ReplayEvent.SPAWN))
+        self.file.write(POINT.pack(*point_state(point)))
+
+    def click(self, tick, position):
+        self.file.write(EVENT.pack(tick, ReplayEvent.CLICK))
+        self.file.write(CLICK.pack(*position))
+
+    def close(self, tick):
+        if self.file is None:
+            return
+
+        self.file.write(EVENT.pack(tick, ReplayEvent.END))
+        self.file.close()
+        self.file = None
+
+
+class Replay:
+    # A recorded game, read whole. The scene asks it for the input of every
+    # tick instead of taking it from the player and the random generator.
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+
+        magic, version, flags, self.tick_rate, self.seed, name_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a game log this version can play")
+
+        offset = HEADER.size
+        self.difficulty = data[offset : offset + name_length].decode()
+        self.ccd = bool(flags & FLAG_CCD)
+        offset += name_length
+
+        (count,) = POINT_COUNT.unpack_from(data, offset)
+        offset += POINT_COUNT.size
+        self.initial_points = [
+            POINT.unpack_from(data, offset + i * POINT.size) for i in range(count)
+        ]
+        offset += count * POINT.size
+
+        self.spawns = {}
+        self.clicks = {}
+        # A log cut short (the game crashed) plays up to its last event
+        self.end_tick = None
+
+        while offset + EVENT.size <= len(data):
+            tick, kind = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+
+            if kind == ReplayEvent.SPAWN:
+                self.spawns[tick] = POINT.unpack_from(data, offset)
+                offset += POINT.size
+            elif kind == ReplayEvent.CLICK:
+                self.clicks.setdefault(tick, []).append(CLICK.unpack_from(data, offset))
+                offset += CLICK.size
+            else:
+                self.end_tick = tick
+                break
+
+        if self.end_tick is None:
+            self.end_tick = max(list(self.spawns) + list(self.clicks), default=0)
+
+    def finished(self, tick):
+        return tick >= self.end_tick
@@ -0,0 +1,166 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from src.config import TRAJECTORY_INITIAL_RECORDS
+
+# Every file is a fixed size header followed by fixed width records. The
+# header says how many records there are and their layout, as the fields of
+# a numpy dtype in JSON, so the records map straight into an array.
+MAGIC = b"QTTR"
+VERSION = 1
+HEADER_SIZE = 256
+
+# Magic, version, kind of records, number of records, then the layout
+HEADER = struct.Struct("<4sH10sQ")
+
+# Position of a point after a tick, by its slot in the point buffer
+POSITION = np.dtype([("tick", "<u4"), ("point", "<u4"), ("x", "<f4"), ("y", "<f4")])
+# Pair of colliding points found in a tick
+COLLISION = np.dtype([("tick", "<u4"), ("point", "<u4"), ("other", "<u4")])
+
+
+class RecordWriter:
+    # Appends records to a memory mapped file, so they go to the page cache
+    # instead of piling up in the process. The file is made bigger by
+    # doubling when full and cut to the records written when closed.
+    def __init__(self, path, kind, dtype, capacity=TRAJECTORY_INITIAL_RECORDS):
+        self.path = path
+        self.kind = kind
+        self.dtype = dtype
+        self.count = 0
+        self.capacity = max(1, capacity)
+
+        with open(path, "wb") as file:
+            file.write(self.header())
+            file.truncate(HEADER_SIZE + self.capacity * dtype.itemsize)
+
+        self.records = self.map()
+
+    def header(self):
+        layout = json.dumps(self.dtype.descr).encode()
+        header = HEADER.pack(MAGIC, VERSION, self.kind.encode(), self.count) + layout
+        if len(header) > HEADER_SIZE:
+            raise ValueError(f"Layout of {self.kind} records does not fit the header")
+
+        return header.ljust(HEADER_SIZE, b" ")
+
+    def map(self):
+        return np.memmap(
+            self.path, self.dtype, "r+", offset=HEADER_SIZE, shape=(self.capacity,)
+        )
+
+    def reserve(self, amount):
+        # The next amount records, to be filled in place
+        if self.count + amount > self.capacity:
+            self.grow(self.count + amount)
+
+        records = self.records[self.count : self.count + amount]
+        self.count += amount
+        return records
+
+    def grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+
+        self.records.flush()
+        self.records = None
+        os.truncate(self.path, HEADER_SIZE + capacity * self.dtype.itemsize)
+
+        self.capacity = capacity
+        self.records = self.map()
+        self.write_header()
+
+    def write_header(self):
+        # The count in the header is what a reader trusts, it is kept up to
+        # date whenever the file changes size
+        with open(self.path, "r+b") as file:
+            file.write(self.header())
+
+    def close(self):
+        if self.records is None:
+            return
+
+        self.records.flush()
+        self.records = None
+        os.truncate(self.path, HEADER_SIZE + self.count * self.dtype.itemsize)
+        self.write_header()
+
+
+def read_records(path):
+    # The records of a file as a read only array mapped on it. Slicing it
+    # copies nothing and only the pages touched are ever read.
+    with open(path, "rb") as file:
+        header = file.read(HEADER_SIZE)
+
+    magic, version, kind, count = HEADER.unpack_from(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a trajectory file this version can read")
+
+    layout = json.loads(header[HEADER.size :].decode().strip())
+    dtype = np.dtype([tuple(field) for field in layout])
+
+    if count == 0:
+        return np.zeros(0, dtype)
+
+    return np.memmap(path, dtype, "r", offset=HEADER_SIZE, shape=(count,))
+
+
+class TrajectoryExporter:
+    # Streams the position of every point after every tick, and every
+    # colliding pair, to path.positions and path.collisions
+    def __init__(self, path):
+        self.positions = RecordWriter(f"{path}.positions", "positions", POSITION)
+        self.collisions = RecordWriter(f"{path}.collisions", "collisions", COLLISION)
+
+    def write_tick(self, tick, point_buffer):
+        size = point_buffer.size
+        records = self.positions.reserve(size)
+
+        records["tick"] = tick
+        records["point"] = np.arange(size, dtype=np.uint32)
+        records["x"] = point_buffer.x[:size]
+        records["y"] = point_buffer.y[:size]
+
+    def write_collisions(self, tick, pairs):
+        indices = [(point.index, other.index) for point, other in pairs]
+        if not indices:
+            return
+
+        records = self.collisions.reserve(len(indices))
+        records["tick"] = tick
+        records["point"], records["other"] = np.array(indices, dtype=np.uint32).T
+
+    def close(self):
+        self.positions.close()
+        self.collisions.close()
+
+
+class TrajectoryReader:
+    # Records are written tick by tick, so the ticks are sorted and a range
+    # of them is found by binary search on the mapped file
+    def __init__(self, path):
+        self.positions = read_records(f"{path}.positions")
+        self.collisions = read_records(f"{path}.collisions")
+
+    @staticmethod
+    def tick_range(records, start, stop):
+        ticks = records["tick"]
+        return records[ticks.searchsorted(start) : ticks.searchsorted(stop)]
+
+    def positions_between(self, start, stop):
+        return self.tick_range(self.positions, start, stop)
+
+    def positions_at(self, tick):
+        return self.positions_between(tick, tick + 1)
+
+    def collisions_between(self, start, stop):
+        return self.tick_range(self.collisions, start, stop)
+
+    def ticks(self):
+        if len(self.positions) == 0:
+            return 0
+        return int(self.positions["tick"][-1]) + 1